@@ -2,8 +2,13 @@ from crewai import Agent, Task, Crew, Process
 from crewai.tools import tool
 from langchain_groq import ChatGroq
 from langchain.schema import HumanMessage
+import io
 import os
+import re
 import json
+import logging
+import orjson
+import asyncio
 import smtplib
 import ssl
 from email.mime.multipart import MIMEMultipart
@@ -11,16 +16,42 @@ from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 from datetime import datetime, timedelta
+from functools import lru_cache
+from xml.sax.saxutils import escape as xml_escape
 from dotenv import load_dotenv
+try:
+    import ahocorasick  # optional: pyahocorasick
+except ImportError:
+    ahocorasick = None
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch
+from reportlab.pdfbase import pdfmetrics
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 groq_api_key = os.getenv("GROQ_API_KEY")
+# Agents reason with the large model; the structured feature extraction only
+# fills a fixed JSON schema, so it runs on the faster instant model
+LLM_MODEL = os.getenv("DIAGNOWISE_LLM_MODEL", "llama-3.1-70b-versatile")
+EXTRACTION_MODEL = os.getenv("DIAGNOWISE_EXTRACTION_MODEL", "llama-3.1-8b-instant")
+EXTRACTION_MAX_TOKENS = 400
+# Rate-limited (429) calls are retried with exponential backoff by the Groq client
+LLM_MAX_RETRIES = 5
+# Patients processed at once by process_patients_with_auto_email_batch
+BATCH_CONCURRENCY = int(os.getenv("DIAGNOWISE_BATCH_CONCURRENCY", "8"))
+
+@lru_cache(maxsize=8)
+def _get_llm(model: str = LLM_MODEL, temperature: float = 0.2, max_tokens: int = None,
+             json_mode: bool = False) -> ChatGroq:
+    """Return the shared ChatGroq client (and its connection pool) for these settings"""
+    model_kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+    return ChatGroq(api_key=groq_api_key, model=model, temperature=temperature, max_tokens=max_tokens,
+                    max_retries=LLM_MAX_RETRIES, model_kwargs=model_kwargs)
 
 # Email configuration - Add these to your .env file
 SMTP_SERVER = "smtp.gmail.com"
@@ -60,10 +91,68 @@ HEALTHCARE_PROVIDERS = {
     }
 }
 
+# Keyword -> (provider position, specialty), built once. A keyword listed by several
+# providers keeps the first one, and the lowest position among the matches wins, so
+# the result is the same as scanning providers in table order.
+_KEYWORD_TO_SPECIALTY = {}
+for _priority, (_specialty, _provider) in enumerate(HEALTHCARE_PROVIDERS.items()):
+    for _keyword in _provider['specializations']:
+        _KEYWORD_TO_SPECIALTY.setdefault(_keyword.lower(), (_priority, _specialty))
+_SPECIALTY_RE = re.compile(
+    '|'.join(re.escape(k) for k in sorted(_KEYWORD_TO_SPECIALTY, key=len, reverse=True)),
+    re.IGNORECASE
+)
+_KEYWORD_SET = frozenset(_KEYWORD_TO_SPECIALTY)
+# The exact-keyword shortcut is only sound while no keyword contains another one
+_KEYWORDS_NESTED = any(a != b and a in b for a in _KEYWORD_SET for b in _KEYWORD_SET)
+
+# With pyahocorasick installed, every keyword (overlapping ones included) is found
+# in one pass over the text; otherwise the compiled regex above is used
+_KEYWORD_AUTOMATON = None
+if ahocorasick is not None:
+    _KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for _keyword, _match in _KEYWORD_TO_SPECIALTY.items():
+        _KEYWORD_AUTOMATON.add_word(_keyword, _match)
+    _KEYWORD_AUTOMATON.make_automaton()
+
+def determine_specialty(symptoms: list) -> str:
+    """Pick the specialty whose provider lists a keyword found in the symptoms"""
+    # Form input may also pack several symptoms into one comma-separated entry
+    normalized = [part.strip().lower() for symptom in symptoms for part in symptom.split(',')]
+    if normalized and not _KEYWORDS_NESTED and _KEYWORD_SET.issuperset(normalized):
+        # Every symptom is itself a listed keyword (typical for form input): set lookups, no scan
+        return min(_KEYWORD_TO_SPECIALTY[symptom] for symptom in normalized)[1]
+    if _KEYWORD_AUTOMATON is not None:
+        matches = (match for _, match in _KEYWORD_AUTOMATON.iter(" ".join(symptoms).lower()))
+    else:
+        matches = (_KEYWORD_TO_SPECIALTY[m.group(0).lower()] for m in _SPECIALTY_RE.finditer(" ".join(symptoms)))
+    return min(matches, default=(None, "internal_medicine"))[1]
+
+def _raw_output(output) -> str:
+    """Return a CrewOutput's raw text, falling back to str() for other results"""
+    raw = getattr(output, 'raw', None)
+    return raw if isinstance(raw, str) else str(output)
+
+_JSON_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+
+def _extract_json(text: str):
+    """Return the JSON object in an agent answer (bare, ```json fenced or wrapped in prose), else None"""
+    fenced = _JSON_FENCE_RE.search(text)
+    candidate = fenced.group(1) if fenced else text
+    start, end = candidate.find('{'), candidate.rfind('}')
+    if start == -1 or end < start:
+        return None
+    candidate = candidate[start:end + 1]
+    try:
+        orjson.loads(candidate)
+    except orjson.JSONDecodeError:
+        return None
+    return candidate
+
 @tool
 def extract_comprehensive_medical_features(medical_history: str, symptoms: list, urgency: str) -> dict:
     """Enhanced medical feature extraction with urgency assessment using Groq"""
-    llm = ChatGroq(api_key=groq_api_key, model="llama-3.1-70b-versatile", temperature=0.2, max_tokens=600)
+    llm = _get_llm(EXTRACTION_MODEL, 0.2, EXTRACTION_MAX_TOKENS, json_mode=True)
     
     prompt = f"""
     Perform comprehensive medical analysis:
@@ -92,12 +181,14 @@ def extract_comprehensive_medical_features(medical_history: str, symptoms: list,
         "immediate_care": [...],
         "summary": "..."
     }}
+    
+    Return only valid JSON.
     """
     
     try:
         response = llm.invoke([HumanMessage(content=prompt)])
-        result = json.loads(response.content)
-        return json.dumps(result, indent=2)
+        result = orjson.loads(response.content)
+        return orjson.dumps(result, option=orjson.OPT_INDENT_2).decode()
     except Exception as e:
         return json.dumps({
             "risk_factors": ["Analysis unavailable"],
@@ -115,38 +206,36 @@ def schedule_optimal_appointment(symptoms: list, urgency: str, preferred_date: s
     """Enhanced appointment scheduling with preference consideration"""
     
     # Determine best specialty based on symptoms
-    symptom_text = " ".join(symptoms).lower()
-    best_specialty = "internal_medicine"  # default
-    
-    for specialty, provider in HEALTHCARE_PROVIDERS.items():
-        if any(spec in symptom_text for spec in provider['specializations']):
-            best_specialty = specialty
-            break
-    
+    best_specialty = determine_specialty(symptoms)
     provider = HEALTHCARE_PROVIDERS[best_specialty]
     
+    # One clock reading and at most one date parse per call. The emergency path
+    # ignores the preference, so a malformed date is treated as "no preference"
+    now = datetime.now()
+    pref_date = None
+    if preferred_date and urgency != "emergency":
+        try:
+            pref_date = datetime.strptime(preferred_date, '%Y-%m-%d')
+        except ValueError:
+            logger.warning("Ignoring malformed preferred date: %s", preferred_date)
+    
     # Calculate appointment timing based on urgency and preferences
     if urgency == "emergency":
-        date = datetime.now().strftime('%Y-%m-%d')
+        date = now.strftime('%Y-%m-%d')
         time = "IMMEDIATE - Emergency Department"
         location = "Emergency Department"
     elif urgency == "urgent":
         # Try to accommodate within 1-2 days
-        target_date = datetime.now() + timedelta(days=1)
-        if preferred_date:
-            pref_date = datetime.strptime(preferred_date, '%Y-%m-%d')
-            if pref_date <= datetime.now() + timedelta(days=2):
-                target_date = pref_date
+        target_date = now + timedelta(days=1)
+        if pref_date and pref_date <= now + timedelta(days=2):
+            target_date = pref_date
         
         date = target_date.strftime('%Y-%m-%d')
         time = preferred_time if preferred_time in provider['available_slots'] else provider['available_slots'][0]
         location = provider['location']
     else:  # routine
         # Try to accommodate preferred date/time
-        if preferred_date:
-            target_date = datetime.strptime(preferred_date, '%Y-%m-%d')
-        else:
-            target_date = datetime.now() + timedelta(days=3)
+        target_date = pref_date or now + timedelta(days=3)
         
         date = target_date.strftime('%Y-%m-%d')
         time = preferred_time if preferred_time in provider['available_slots'] else provider['available_slots'][0]
@@ -159,35 +248,102 @@ def schedule_optimal_appointment(symptoms: list, urgency: str, preferred_date: s
         'date': date,
         'time': time,
         'location': location,
-        'appointment_id': f"APPT_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        'appointment_id': f"APPT_{now.strftime('%Y%m%d_%H%M%S')}",
         'scheduling_rationale': f"Selected {best_specialty} based on symptoms. Urgency: {urgency}."
     }
 
 class EnhancedMedicalReportGenerator:
+    _style_cache = None
+    PRE_APPOINTMENT_INSTRUCTIONS = (
+        "Arrive 15 minutes early with valid ID and insurance cards",
+        "Bring all current medications and previous medical records",
+        "Prepare a list of questions based on this medical analysis",
+        "Fast for 8-12 hours if blood work is required",
+        "Bring a family member if needed for support"
+    )
+    
+    @classmethod
+    def _styles(cls) -> dict:
+        """Build the stylesheet, paragraph styles and table styles once per process"""
+        if cls._style_cache is None:
+            # Helvetica is a built-in base font; loading its metrics here keeps that
+            # one-off cost out of the first report
+            for font_name in ('Helvetica', 'Helvetica-Bold'):
+                pdfmetrics.getFont(font_name)
+            styles = getSampleStyleSheet()
+            cls._style_cache = {
+                'normal': styles['Normal'],
+                'title': ParagraphStyle('CustomTitle', parent=styles['Heading1'], 
+                                        fontSize=20, spaceAfter=30, textColor=colors.darkblue, 
+                                        alignment=1, fontName='Helvetica-Bold'),
+                'heading': ParagraphStyle('CustomHeading', parent=styles['Heading2'], 
+                                          fontSize=16, spaceAfter=15, textColor=colors.darkred,
+                                          fontName='Helvetica-Bold'),
+                'subheading': ParagraphStyle('SubHeading', parent=styles['Heading3'],
+                                             fontSize=12, spaceAfter=10, textColor=colors.darkgreen,
+                                             fontName='Helvetica-Bold'),
+                'footer': ParagraphStyle('Footer', parent=styles['Normal'], fontSize=9, 
+                                         textColor=colors.grey, alignment=1),
+                'info_table': TableStyle([
+                    ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 0), (-1, -1), 11),
+                    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
+                ]),
+                'appt_table': TableStyle([
+                    ('BACKGROUND', (0, 0), (0, -1), colors.lightgreen),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 0), (-1, -1), 11),
+                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
+                ]),
+                # Static paragraph markup, joined once
+                'instructions_markup': cls._bullets("•", cls.PRE_APPOINTMENT_INSTRUCTIONS),
+            }
+        return cls._style_cache
+    
     @staticmethod
-    def generate_comprehensive_pdf_report(patient_data: dict, medical_analysis: str, appointment_details: dict) -> str:
-        """Generate enhanced comprehensive medical PDF report"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    def generate_comprehensive_pdf_report(patient_data: dict, medical_analysis: str, appointment_details: dict,
+                                          persist_to_disk: bool = False) -> tuple:
+        """
+        Generate enhanced comprehensive medical PDF report in memory.
+        
+        Returns (filename, pdf_bytes); the report holds PHI, so the file is only
+        written to the working directory when persist_to_disk is set.
+        """
+        now = datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
         filename = f"comprehensive_medical_report_{patient_data['name'].replace(' ', '_')}_{timestamp}.pdf"
         
-        doc = SimpleDocTemplate(filename, pagesize=letter, topMargin=0.5*inch)
-        story = []
-        styles = getSampleStyleSheet()
+        pdf_bytes = EnhancedMedicalReportGenerator._render_pdf(patient_data, medical_analysis, appointment_details, now)
         
-        # Enhanced custom styles
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], 
-                                   fontSize=20, spaceAfter=30, textColor=colors.darkblue, 
-                                   alignment=1, fontName='Helvetica-Bold')
-        heading_style = ParagraphStyle('CustomHeading', parent=styles['Heading2'], 
-                                     fontSize=16, spaceAfter=15, textColor=colors.darkred,
-                                     fontName='Helvetica-Bold')
-        subheading_style = ParagraphStyle('SubHeading', parent=styles['Heading3'],
-                                        fontSize=12, spaceAfter=10, textColor=colors.darkgreen,
-                                        fontName='Helvetica-Bold')
+        if persist_to_disk:
+            with open(filename, 'wb') as pdf_file:
+                pdf_file.write(pdf_bytes)
+        return filename, pdf_bytes
+    
+    @staticmethod
+    def _bullets(marker: str, items) -> str:
+        """Join items into one escaped, <br/>-separated bullet list for a single Paragraph"""
+        return "<br/>".join(f"{marker} {xml_escape(str(item))}" for item in items)
+    
+    @staticmethod
+    def _render_pdf(patient_data: dict, medical_analysis: str, appointment_details: dict, now: datetime) -> bytes:
+        """Lay out the report with ReportLab and return the PDF bytes"""
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.5*inch)
+        story = []
+        cached = EnhancedMedicalReportGenerator._styles()
+        normal_style = cached['normal']
+        title_style = cached['title']
+        heading_style = cached['heading']
+        bullets = EnhancedMedicalReportGenerator._bullets
         
         # Title and header
         story.append(Paragraph("COMPREHENSIVE AI MEDICAL ANALYSIS REPORT", title_style))
-        story.append(Paragraph("Advanced Healthcare AI System with Groq", styles['Normal']))
+        story.append(Paragraph("Advanced Healthcare AI System with Groq", normal_style))
         story.append(Spacer(1, 20))
         
         # Patient information table
@@ -195,27 +351,19 @@ class EnhancedMedicalReportGenerator:
             ['Patient Name:', patient_data['name']],
             ['Email:', patient_data['email']],
             ['Phone:', patient_data.get('phone', 'Not provided')],
-            ['Report Date:', datetime.now().strftime("%B %d, %Y at %I:%M %p")],
+            ['Report Date:', now.strftime("%B %d, %Y at %I:%M %p")],
             ['Appointment ID:', appointment_details['appointment_id']],
             ['Urgency Level:', patient_data.get('urgency_level', 'Routine').title()]
         ]
         
         info_table = Table(patient_info, colWidths=[2*inch, 4*inch])
-        info_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
-        ]))
+        info_table.setStyle(cached['info_table'])
         story.append(info_table)
         story.append(Spacer(1, 25))
         
         # Current symptoms section
         story.append(Paragraph("PRESENTING SYMPTOMS & CONCERNS", heading_style))
-        for i, symptom in enumerate(patient_data['symptoms'], 1):
-            story.append(Paragraph(f"• {symptom}", styles['Normal']))
+        story.append(Paragraph(bullets("•", patient_data['symptoms']), normal_style))
         story.append(Spacer(1, 20))
         
         # Enhanced medical analysis
@@ -225,49 +373,45 @@ class EnhancedMedicalReportGenerator:
             # Risk factors
             story.append(Paragraph("IDENTIFIED RISK FACTORS", heading_style))
             if analysis_data.get('risk_factors'):
-                for risk in analysis_data['risk_factors']:
-                    story.append(Paragraph(f"⚠️ {risk}", styles['Normal']))
+                story.append(Paragraph(bullets("⚠️", analysis_data['risk_factors']), normal_style))
             else:
-                story.append(Paragraph("No specific risk factors identified from available information.", styles['Normal']))
+                story.append(Paragraph("No specific risk factors identified from available information.", normal_style))
             story.append(Spacer(1, 15))
             
             # Differential diagnosis
             if analysis_data.get('differential_diagnosis'):
                 story.append(Paragraph("DIFFERENTIAL DIAGNOSIS CONSIDERATIONS", heading_style))
-                for diagnosis in analysis_data['differential_diagnosis']:
-                    story.append(Paragraph(f"• {diagnosis}", styles['Normal']))
+                story.append(Paragraph(bullets("•", analysis_data['differential_diagnosis']), normal_style))
                 story.append(Spacer(1, 15))
             
             # Medication alerts
             story.append(Paragraph("MEDICATION ALERTS & PRECAUTIONS", heading_style))
             if analysis_data.get('medication_alerts'):
-                for alert in analysis_data['medication_alerts']:
-                    story.append(Paragraph(f"🚨 {alert}", styles['Normal']))
+                story.append(Paragraph(bullets("🚨", analysis_data['medication_alerts']), normal_style))
             else:
-                story.append(Paragraph("No specific medication alerts identified.", styles['Normal']))
+                story.append(Paragraph("No specific medication alerts identified.", normal_style))
             story.append(Spacer(1, 15))
             
             # Clinical correlation
             if analysis_data.get('clinical_correlation'):
                 story.append(Paragraph("CLINICAL CORRELATION", heading_style))
-                story.append(Paragraph(analysis_data['clinical_correlation'], styles['Normal']))
+                story.append(Paragraph(analysis_data['clinical_correlation'], normal_style))
                 story.append(Spacer(1, 15))
             
             # Immediate care recommendations
             if analysis_data.get('immediate_care'):
                 story.append(Paragraph("IMMEDIATE CARE RECOMMENDATIONS", heading_style))
-                for care in analysis_data['immediate_care']:
-                    story.append(Paragraph(f"✓ {care}", styles['Normal']))
+                story.append(Paragraph(bullets("✓", analysis_data['immediate_care']), normal_style))
                 story.append(Spacer(1, 15))
             
             # Clinical summary
             story.append(Paragraph("COMPREHENSIVE CLINICAL ASSESSMENT", heading_style))
             summary = analysis_data.get('summary', 'No summary available')
-            story.append(Paragraph(summary, styles['Normal']))
+            story.append(Paragraph(summary, normal_style))
             
         except Exception as e:
             story.append(Paragraph("MEDICAL ANALYSIS", heading_style))
-            story.append(Paragraph(str(medical_analysis), styles['Normal']))
+            story.append(Paragraph(str(medical_analysis), normal_style))
         
         story.append(Spacer(1, 25))
         
@@ -283,37 +427,22 @@ class EnhancedMedicalReportGenerator:
         ]
         
         appt_table = Table(appt_info, colWidths=[2*inch, 4*inch])
-        appt_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgreen),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 11),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE')
-        ]))
+        appt_table.setStyle(cached['appt_table'])
         story.append(appt_table)
         
         # Pre-appointment instructions
         story.append(Spacer(1, 20))
         story.append(Paragraph("PRE-APPOINTMENT INSTRUCTIONS", heading_style))
-        instructions = [
-            "Arrive 15 minutes early with valid ID and insurance cards",
-            "Bring all current medications and previous medical records",
-            "Prepare a list of questions based on this medical analysis",
-            "Fast for 8-12 hours if blood work is required",
-            "Bring a family member if needed for support"
-        ]
-        for instruction in instructions:
-            story.append(Paragraph(f"• {instruction}", styles['Normal']))
+        story.append(Paragraph(cached['instructions_markup'], normal_style))
         
         # Footer
         story.append(Spacer(1, 30))
-        footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=9, 
-                                    textColor=colors.grey, alignment=1)
+        footer_style = cached['footer']
         story.append(Paragraph("AI-Generated Comprehensive Medical Report - Powered by Groq", footer_style))
         story.append(Paragraph("This report is generated by AI and should be reviewed by a qualified healthcare professional", footer_style))
         
         doc.build(story)
-        return filename
+        return buffer.getvalue()
 
 class AutomatedEmailService:
     def __init__(self):
@@ -323,7 +452,8 @@ class AutomatedEmailService:
         self.email_password = EMAIL_PASSWORD
     
     def send_comprehensive_medical_email(self, patient_email: str, patient_name: str, 
-                                       appointment_details: dict, pdf_path: str = None) -> bool:
+                                       appointment_details: dict, pdf_path: str = None,
+                                       pdf_bytes: bytes = None) -> bool:
         """Send comprehensive medical report via email automatically to the PATIENT'S email"""
         try:
             # Create message
@@ -386,11 +516,13 @@ Patient Email: {patient_email}
             
             msg.attach(MIMEText(email_body, 'plain'))
             
-            # Attach PDF if available
-            if pdf_path and os.path.exists(pdf_path):
+            # Attach PDF if available (in-memory bytes first, then a file on disk)
+            if pdf_bytes is None and pdf_path and os.path.exists(pdf_path):
                 with open(pdf_path, "rb") as attachment:
-                    part = MIMEBase('application', 'octet-stream')
-                    part.set_payload(attachment.read())
+                    pdf_bytes = attachment.read()
+            if pdf_bytes is not None:
+                part = MIMEBase('application', 'octet-stream')
+                part.set_payload(pdf_bytes)
                 
                 encoders.encode_base64(part)
                 part.add_header(
@@ -406,20 +538,20 @@ Patient Email: {patient_email}
                 server.login(self.email_address, self.email_password)
                 server.send_message(msg)
             
-            print(f"✅ Email sent successfully to PATIENT: {patient_email}")
+            logger.info("✅ Email sent successfully to PATIENT: %s", patient_email)
             return True
             
         except Exception as e:
-            print(f"❌ Email sending failed: {str(e)}")
+            logger.error("❌ Email sending failed: %s", e)
             return False
 
 class EnhancedHealthcareCrewAI:
     def __init__(self):
-        self.llm = ChatGroq(api_key=groq_api_key, model="llama-3.1-70b-versatile", temperature=0.2)
+        self.llm = _get_llm(LLM_MODEL, 0.2)
         self.report_generator = EnhancedMedicalReportGenerator()
         self.email_service = AutomatedEmailService()
     
-    def create_enhanced_medical_history_agent(self) -> Agent:
+    def create_enhanced_medical_history_agent(self, max_iter: int = 1) -> Agent:
         return Agent(
             role="Senior Medical History Analyst",
             goal="Perform comprehensive analysis of patient medical history with advanced risk assessment",
@@ -430,7 +562,7 @@ class EnhancedHealthcareCrewAI:
             llm=self.llm,
             verbose=True,
             allow_delegation=False,
-            max_iter=3
+            max_iter=max_iter
         )
     
     def create_advanced_symptom_analyzer(self) -> Agent:
@@ -443,21 +575,7 @@ class EnhancedHealthcareCrewAI:
             llm=self.llm,
             verbose=True,
             allow_delegation=False,
-            max_iter=3
-        )
-    
-    def create_intelligent_appointment_scheduler(self) -> Agent:
-        return Agent(
-            role="Intelligent Healthcare Appointment Coordinator",
-            goal="Optimize appointment scheduling based on medical urgency and patient preferences",
-            backstory="Advanced scheduling AI that considers symptom urgency, specialist availability, patient preferences, "
-                     "and optimal care pathways to coordinate the most appropriate healthcare appointments. "
-                     "Specializes in matching patients with the right specialists at the right time. Powered by Groq.",
-            tools=[schedule_optimal_appointment],
-            llm=self.llm,
-            verbose=True,
-            allow_delegation=False,
-            max_iter=2
+            max_iter=1
         )
     
     def create_comprehensive_medical_analysis_task(self, agent: Agent, patient_data: dict) -> Task:
@@ -519,155 +637,136 @@ class EnhancedHealthcareCrewAI:
             expected_output="Detailed clinical assessment with urgency classification and specialist recommendations"
         )
     
-    def create_intelligent_scheduling_task(self, agent: Agent, patient_data: dict, clinical_assessment: str) -> Task:
-        preferred_date = patient_data.get('preferred_date', '')
-        preferred_time = patient_data.get('preferred_time', '')
-        urgency = patient_data.get('urgency_level', 'routine')
+    def process_patient_with_auto_email(self, patient_data: dict) -> dict:
+        """Synchronous wrapper around process_patient_with_auto_email_async"""
+        return asyncio.run(self.process_patient_with_auto_email_async(patient_data))
+    
+    async def process_patients_with_auto_email_batch(self, patients: list, concurrency: int = BATCH_CONCURRENCY) -> list:
+        """Process independent patients concurrently, at most `concurrency` at a time; results keep input order"""
+        semaphore = asyncio.Semaphore(concurrency)
         
-        return Task(
-            description=f"""
-            Intelligent appointment coordination for: {patient_data['name']}
-            Patient Email: {patient_data['email']}
-            
-            SCHEDULING PARAMETERS:
-            - Clinical Assessment: {clinical_assessment}
-            - Patient Preferences: Date: {preferred_date}, Time: {preferred_time}
-            - Urgency Level: {urgency}
-            - Available Providers: {HEALTHCARE_PROVIDERS}
-            
-            SCHEDULING OPTIMIZATION:
-            1. Match patient with most appropriate healthcare provider
-            2. Consider urgency level for appointment timing
-            3. Accommodate patient preferences when medically appropriate
-            4. Optimize appointment timing based on clinical needs
-            5. Provide pre-appointment preparation requirements
-            6. Plan follow-up care coordination
-            7. Consider provider availability and specialization match
-            
-            Use the schedule_optimal_appointment tool for intelligent scheduling.
-            Provide comprehensive appointment coordination plan with rationale.
-            """,
-            agent=agent,
-            expected_output="Detailed appointment coordination with provider matching and optimal timing"
-        )
+        async def process_one(patient_data: dict) -> dict:
+            async with semaphore:
+                return await self.process_patient_with_auto_email_async(patient_data)
+        
+        return await asyncio.gather(*(process_one(patient) for patient in patients))
     
-    def process_patient_with_auto_email(self, patient_data: dict) -> dict:
+    async def process_patient_with_auto_email_async(self, patient_data: dict) -> dict:
         """Enhanced patient processing with automatic email delivery to PATIENT'S email"""
-        print(f"\n🚀 Starting comprehensive medical processing for: {patient_data['name']}")
-        print(f"📧 Email will be sent to: {patient_data['email']}")
-        print("=" * 70)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("🚀 Starting comprehensive medical processing for: %s", patient_data['name'])
+            logger.info("📧 Email will be sent to: %s", patient_data['email'])
+            logger.info("=" * 70)
         
         try:
             # Create enhanced specialized agents
-            print("🤖 Initializing advanced medical AI agents with Groq...")
+            logger.info("🤖 Initializing advanced medical AI agents with Groq...")
             history_agent = self.create_enhanced_medical_history_agent()
             symptom_agent = self.create_advanced_symptom_analyzer()
-            scheduler_agent = self.create_intelligent_appointment_scheduler()
-            
-            # Step 1: Comprehensive Medical History Analysis
-            print("\n📋 STEP 1: Comprehensive Medical History Analysis")
-            print("🔍 Analyzing patient history, risk factors, and medical correlations...")
-            history_task = self.create_comprehensive_medical_analysis_task(history_agent, patient_data)
-            history_crew = Crew(agents=[history_agent], tasks=[history_task], process=Process.sequential)
-            history_analysis = history_crew.kickoff()
-            print("✅ Medical history analysis completed")
-            
-            # Step 2: Advanced Clinical Symptom Assessment
-            print("\n🩺 STEP 2: Advanced Clinical Symptom Assessment")
-            print("🔬 Evaluating symptoms, differential diagnosis, and urgency...")
-            symptom_task = self.create_advanced_symptom_assessment_task(symptom_agent, patient_data, str(history_analysis))
-            symptom_crew = Crew(agents=[symptom_agent], tasks=[symptom_task], process=Process.sequential)
-            clinical_assessment = symptom_crew.kickoff()
-            print("✅ Clinical symptom assessment completed")
-            
-            # Step 3: Intelligent Appointment Coordination
-            print("\n📅 STEP 3: Intelligent Appointment Coordination")
-            print("🎯 Matching with optimal healthcare provider and scheduling...")
-            scheduling_task = self.create_intelligent_scheduling_task(scheduler_agent, patient_data, str(clinical_assessment))
-            scheduling_crew = Crew(agents=[scheduler_agent], tasks=[scheduling_task], process=Process.sequential)
-            appointment_coordination = scheduling_crew.kickoff()
-            print("✅ Appointment coordination completed")
             
-            # Step 4: Generate Comprehensive PDF Report
-            print("\n📄 STEP 4: Generating Comprehensive Medical Report")
-            print("📝 Creating detailed PDF report with all analysis results...")
-            
-            # Extract appointment details from coordination result
-            coordination_text = str(appointment_coordination).lower()
             urgency = patient_data.get('urgency_level', 'routine')
             
-            # Use the scheduling tool to get structured appointment details
-            appointment_details = schedule_optimal_appointment(
+            # Scheduling is deterministic, so it runs without an agent or LLM call
+            # (.func bypasses the CrewAI tool wrapper); the PDF and email reuse this booking
+            logger.info("📅 Intelligent Appointment Coordination")
+            logger.info("🎯 Matching with optimal healthcare provider and scheduling...")
+            appointment_details = schedule_optimal_appointment.func(
                 patient_data['symptoms'], 
                 urgency, 
                 patient_data.get('preferred_date', ''),
                 patient_data.get('preferred_time', '')
             )
+            appointment_coordination = json.dumps(appointment_details)
+            logger.info("✅ Appointment coordination completed")
             
-            # Parse the tool result if it's a string
-            if isinstance(appointment_details, str):
-                try:
-                    appointment_details = json.loads(appointment_details)
-                except:
-                    # Fallback appointment details
-                    appointment_details = {
-                        'doctor': 'Dr. Amit Singh',
-                        'specialty': 'Internal Medicine',
-                        'date': (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d'),
-                        'time': '10:00 AM',
-                        'location': 'City General Hospital, Bengaluru',
-                        'doctor_email': 'amit.singh@generalhospital.com',
-                        'appointment_id': f"APPT_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                    }
-            
-            pdf_path = self.report_generator.generate_comprehensive_pdf_report(
-                patient_data, str(history_analysis), appointment_details
+            # Step 1: Comprehensive Medical History Analysis
+            logger.info("📋 STEP 1: Comprehensive Medical History Analysis")
+            logger.info("🔍 Analyzing patient history, risk factors, and medical correlations...")
+            history_task = self.create_comprehensive_medical_analysis_task(history_agent, patient_data)
+            history_crew = Crew(agents=[history_agent], tasks=[history_task], process=Process.sequential)
+            history_analysis = _raw_output(await history_crew.kickoff_async())
+            # Final answers often arrive fenced or with a sentence around the JSON; that counts
+            analysis_json = _extract_json(history_analysis)
+            if analysis_json is None:
+                # A single iteration did not yield the JSON analysis; allow the agent a second pass
+                logger.info("🔁 History analysis was not valid JSON, retrying with an extra iteration...")
+                history_agent = self.create_enhanced_medical_history_agent(max_iter=2)
+                history_task = self.create_comprehensive_medical_analysis_task(history_agent, patient_data)
+                history_crew = Crew(agents=[history_agent], tasks=[history_task], process=Process.sequential)
+                history_analysis = _raw_output(await history_crew.kickoff_async())
+                analysis_json = _extract_json(history_analysis)
+            # The report parses the analysis as JSON, so hand it the unwrapped object when there is one
+            history_analysis = analysis_json or history_analysis
+            logger.info("✅ Medical history analysis completed")
+            
+            # Step 3: Generate Comprehensive PDF Report
+            # The report only needs the history analysis and the booking, so it is laid
+            # out on a worker thread while the symptom assessment waits on the LLM
+            logger.info("📄 STEP 3: Generating Comprehensive Medical Report")
+            logger.info("📝 Creating detailed PDF report with all analysis results...")
+            # Rendered in memory only: the email attaches the bytes and the API serves
+            # the copy stored in Redis, so nothing is left on the worker's disk
+            pdf_job = asyncio.to_thread(
+                self.report_generator.generate_comprehensive_pdf_report,
+                patient_data, history_analysis, appointment_details, persist_to_disk=False
             )
-            print(f"✅ Comprehensive PDF report generated: {pdf_path}")
-            
-            # Step 5: Automatic Email Delivery to PATIENT'S EMAIL
-            print("\n📧 STEP 5: Automatic Email Delivery")
-            print(f"📮 Sending comprehensive medical report to PATIENT'S email: {patient_data['email']}")
             
-            email_sent = self.email_service.send_comprehensive_medical_email(
+            # Step 2: Advanced Clinical Symptom Assessment (needs the history analysis)
+            logger.info("🩺 STEP 2: Advanced Clinical Symptom Assessment")
+            logger.info("🔬 Evaluating symptoms, differential diagnosis, and urgency...")
+            symptom_task = self.create_advanced_symptom_assessment_task(symptom_agent, patient_data, history_analysis)
+            symptom_crew = Crew(agents=[symptom_agent], tasks=[symptom_task], process=Process.sequential)
+            symptom_output, (_, pdf_bytes) = await asyncio.gather(symptom_crew.kickoff_async(), pdf_job)
+            clinical_assessment = _raw_output(symptom_output)
+            logger.info("✅ Clinical symptom assessment completed")
+            logger.info("✅ Comprehensive PDF report rendered in memory (%d bytes)", len(pdf_bytes))
+            
+            # Step 4: Automatic Email Delivery to PATIENT'S EMAIL
+            logger.info("📧 STEP 4: Automatic Email Delivery")
+            logger.info("📮 Sending comprehensive medical report to PATIENT'S email: %s", patient_data['email'])
+            
+            # SMTP connect, TLS and login block, so they run on a worker thread too
+            email_sent = await asyncio.to_thread(
+                self.email_service.send_comprehensive_medical_email,
                 patient_data['email'],  # FIXED: Use patient's email from the form
                 patient_data['name'],
                 appointment_details,
-                pdf_path
+                pdf_bytes=pdf_bytes
             )
             
             if email_sent:
-                print(f"✅ Email delivered successfully to: {patient_data['email']}")
+                logger.info("✅ Email delivered successfully to: %s", patient_data['email'])
                 email_status = f"Email sent successfully to {patient_data['email']} with comprehensive medical report"
             else:
-                print("❌ Email delivery failed")
+                logger.error("❌ Email delivery failed")
                 email_status = "Email delivery failed - please check email configuration"
             
-            print("\n🎉 COMPREHENSIVE MEDICAL PROCESSING COMPLETED!")
-            print(f"📊 All AI agents utilized successfully with Groq")
-            print(f"📄 Medical report: {pdf_path}")
-            print(f"📧 Email status: {email_status}")
+            logger.info("🎉 COMPREHENSIVE MEDICAL PROCESSING COMPLETED!")
+            logger.info("📊 All AI agents utilized successfully with Groq")
+            logger.info("📄 Medical report: %d-byte PDF, not written to disk", len(pdf_bytes))
+            logger.info("📧 Email status: %s", email_status)
             
             return {
                 'success': True,
                 'patient_info': patient_data,
-                'medical_history_analysis': str(history_analysis),
-                'clinical_assessment': str(clinical_assessment),
-                'appointment_coordination': str(appointment_coordination),
+                'medical_history_analysis': history_analysis,
+                'clinical_assessment': clinical_assessment,
+                'appointment_coordination': appointment_coordination,
                 'appointment_details': appointment_details,
-                'pdf_report_path': pdf_path,
+                'pdf_bytes': pdf_bytes,
                 'email_sent': email_sent,
                 'email_status': email_status,
                 'urgency': urgency,
-                'processing_summary': 'All CrewAI agents utilized with Groq: Medical History Analyst, Symptom Diagnostician, Appointment Coordinator'
+                'processing_summary': 'All CrewAI agents utilized with Groq: Medical History Analyst, Symptom Diagnostician; appointments scheduled deterministically'
             }
             
         except Exception as e:
-            print(f"❌ Processing failed: {str(e)}")
+            logger.error("❌ Processing failed: %s", e)
             return {'success': False, 'error': str(e)}
 
 # Test the enhanced system
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     print("🚀 Testing Enhanced Healthcare CrewAI System with Groq and Fixed Email")
     
     # Test patient data
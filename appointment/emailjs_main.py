@@ -1,25 +1,188 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from typing import Annotated, List, Optional
 import os
 import json
+import asyncio
+import hashlib
 import uuid
+import logging
+import queue
+import re
+import orjson
+import msgspec
+import redis.asyncio as redis
+from celery import Celery
+from celery.result import AsyncResult
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime, timedelta
 
 # Import Groq crew modules
-from emailjs_crew import EnhancedHealthcareCrewAI, HEALTHCARE_PROVIDERS
+from emailjs_crew import (EnhancedHealthcareCrewAI, HEALTHCARE_PROVIDERS, LLM_MODEL, determine_specialty,
+                          _extract_json, _raw_output)
 from dotenv import load_dotenv
+from email_validator import EmailNotValidError, validate_email
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Show the crew's progress messages (emitted through logging) in the server output.
+# Emitting a record only puts it on a queue; the listener thread writes it out.
+_log_queue = queue.SimpleQueue()
+_console_handler = logging.StreamHandler()
+_console_handler.setFormatter(logging.Formatter("%(message)s"))
+_log_listener = QueueListener(_log_queue, _console_handler)
+
+# Shared storage in Redis, so every uvicorn worker sees the same records.
+# The database index is dedicated to this service: /system/reset flushes it.
+REDIS_URL = os.getenv("DIAGNOWISE_REDIS_URL", "redis://localhost:6379/2")
+# Records age out instead of growing without bound (0 keeps them until /system/reset)
+RECORD_TTL_SECONDS = int(os.getenv("DIAGNOWISE_RECORD_TTL", str(24 * 3600)))
+REPORT_TTL_SECONDS = int(os.getenv("DIAGNOWISE_REPORT_TTL", str(7 * 24 * 3600)))
+ANALYSIS_CACHE_TTL_SECONDS = int(os.getenv("DIAGNOWISE_ANALYSIS_CACHE_TTL", "3600"))
+# How often each API worker drops expired ids from the index sets
+INDEX_PRUNE_INTERVAL_SECONDS = int(os.getenv("DIAGNOWISE_INDEX_PRUNE_INTERVAL", "300"))
+
+store = redis.from_url(REDIS_URL)
+
+# Each record is a hash at "<kind>:<id>" whose field values are JSON-encoded (so the
+# nested appointment details and boolean flags round-trip), and its id is added to
+# the "<kind>s:index" set used for listing. Ids of expired records are pruned from
+# the index as the list endpoints come across them and by a periodic lifespan job,
+# so /system/health can report plain SCARD counts
+async def _save_record(kind: str, record_id: str, record: dict, ttl: Optional[int] = RECORD_TTL_SECONDS):
+    key = f"{kind}:{record_id}"
+    async with store.pipeline(transaction=True) as pipe:
+        pipe.delete(key)
+        pipe.hset(key, mapping={field: orjson.dumps(value) for field, value in record.items()})
+        if ttl:
+            pipe.expire(key, ttl)
+        pipe.sadd(f"{kind}s:index", record_id)
+        await pipe.execute()
+
+def _decode_record(raw: dict) -> dict:
+    return {field.decode(): orjson.loads(value) for field, value in raw.items()}
+
+async def _load_record(kind: str, record_id: str) -> Optional[dict]:
+    raw = await store.hgetall(f"{kind}:{record_id}")
+    return _decode_record(raw) if raw else None
+
+async def _load_records(kind: str, record_ids: list) -> dict:
+    """Fetch several records in one round trip; ids whose hash has expired are skipped"""
+    async with store.pipeline(transaction=False) as pipe:
+        for record_id in record_ids:
+            pipe.hgetall(f"{kind}:{record_id}")
+        rows = await pipe.execute()
+    records = {record_id: _decode_record(raw) for record_id, raw in zip(record_ids, rows) if raw}
+    if len(records) < len(record_ids):
+        await store.srem(f"{kind}s:index", *(record_id for record_id in record_ids if record_id not in records))
+    return records
+
+async def _load_all_records(kind: str) -> dict:
+    record_ids = [record_id.decode() for record_id in await store.smembers(f"{kind}s:index")]
+    return await _load_records(kind, record_ids)
+
+async def _scan_index(kind: str, batch_size: int = 500):
+    """Yield ids from a kind's index set in SSCAN batches, so memory stays bounded"""
+    cursor = 0
+    while True:
+        cursor, record_ids = await store.sscan(f"{kind}s:index", cursor, count=batch_size)
+        if record_ids:
+            yield [record_id.decode() for record_id in record_ids]
+        if cursor == 0:
+            break
+
+# Ids of email logs whose email went out, so health can report the delivery rate
+# without loading the logs
+EMAIL_DELIVERED_KEY = "email_logs:delivered"
+
+async def _prune_index(kind: str, index_key: Optional[str] = None):
+    """Remove ids whose "<kind>:<id>" hash has expired from an index set"""
+    index_key = index_key or f"{kind}s:index"
+    cursor = 0
+    while True:
+        cursor, record_ids = await store.sscan(index_key, cursor, count=500)
+        if record_ids:
+            async with store.pipeline(transaction=False) as pipe:
+                for record_id in record_ids:
+                    pipe.exists(f"{kind}:{record_id.decode()}")
+                rows = await pipe.execute()
+            expired = [record_id for record_id, exists in zip(record_ids, rows) if not exists]
+            if expired:
+                await store.srem(index_key, *expired)
+        if cursor == 0:
+            break
+
+async def _prune_indexes_periodically():
+    while True:
+        await asyncio.sleep(INDEX_PRUNE_INTERVAL_SECONDS)
+        try:
+            for kind in ("patient", "appointment", "report", "email_log"):
+                await _prune_index(kind)
+            await _prune_index("email_log", EMAIL_DELIVERED_KEY)
+        except redis.RedisError as e:
+            logger.warning("⚠️ Index pruning failed: %s", e)
+
+# Patient processing runs on Celery workers, so the API only enqueues it:
+#   celery -A emailjs_main worker --concurrency=8 --pool=prefork
+celery_app = Celery(
+    "diagnowise",
+    broker=os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"),
+    backend=os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/1")
+)
+
+# Blocking crew runs are moved onto the default executor; bound it per worker
+CREW_THREADS = int(os.getenv("DIAGNOWISE_CREW_THREADS", "16"))
+
+# Groq healthcare system, built once per worker process on first use
+healthcare_system = None
+
+def _get_healthcare_system() -> EnhancedHealthcareCrewAI:
+    global healthcare_system
+    if healthcare_system is None:
+        healthcare_system = EnhancedHealthcareCrewAI()
+    return healthcare_system
+
+# Wall-clock ISO timestamp for API responses, refreshed by a lifespan task every 50ms
+# instead of formatted on each request
+_NOW_ISO = datetime.now().isoformat()
+
+async def _tick_now_iso():
+    global _NOW_ISO
+    while True:
+        _NOW_ISO = datetime.now().isoformat()
+        await asyncio.sleep(0.05)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in each uvicorn worker, so the agents and LLM clients are never set up in the parent
+    root_logger = logging.getLogger()
+    root_logger.addHandler(QueueHandler(_log_queue))
+    root_logger.setLevel(logging.INFO)
+    _log_listener.start()
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=CREW_THREADS))
+    _get_healthcare_system()
+    ticker = asyncio.create_task(_tick_now_iso())
+    pruner = asyncio.create_task(_prune_indexes_periodically())
+    yield
+    pruner.cancel()
+    ticker.cancel()
+    await store.aclose()
+    _log_listener.stop()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Groq Healthcare AI API",
     description="Advanced Healthcare AI System with Groq Integration and Fixed Email Delivery",
-    version="3.0.0"
+    version="3.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse  # orjson encodes the list endpoints' dicts in C
 )
 
 # CORS middleware
@@ -31,19 +194,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Groq healthcare system
-healthcare_system = EnhancedHealthcareCrewAI()
+# Reported in responses; the model is configurable through DIAGNOWISE_LLM_MODEL
+LLM_PROVIDER = f"Groq ({LLM_MODEL})"
+
+# Display names for the specialty keys, e.g. "internal_medicine" -> "Internal Medicine"
+SPECIALTY_DISPLAY = {spec: spec.replace("_", " ").title() for spec in HEALTHCARE_PROVIDERS}
+
+# Provider lookup by doctor name, and the slots offered when a provider has none listed
+PROVIDERS_BY_NAME = {provider["name"]: (spec, provider) for spec, provider in HEALTHCARE_PROVIDERS.items()}
+DEFAULT_SLOTS = ("9:00 AM", "10:00 AM", "11:00 AM", "2:00 PM", "3:00 PM", "4:00 PM")
+
+# Constant parts of the endpoint responses, shared instead of rebuilt per request
+PROCESSING_FEATURES = (
+    "Medical History Analyst Agent (Groq)",
+    "Symptom Diagnostician Agent (Groq)",
+    "Deterministic Appointment Scheduler",
+    "Fixed Email Delivery to Patient",
+    "Comprehensive PDF Report"
+)
+ANALYSIS_FEATURES = (
+    "Risk factor assessment (Groq)",
+    "Medication alerts (Groq)",
+    "Differential diagnosis (Groq)",
+    "Clinical correlation (Groq)",
+    "Urgency classification (Groq)",
+    "Fixed email delivery"
+)
 
-# Enhanced in-memory storage
-appointments_db = {}
-patients_db = {}
-reports_db = {}
-email_logs = {}
+# Groq request bodies, decoded and validated by msgspec in a single C pass.
+# The pattern only screens out address lists and display names; _decode_body then
+# runs email_validator, the same check EmailStr used, before the address reaches msg['To']
+EmailAddress = Annotated[str, msgspec.Meta(pattern=r'^[^@\s,;<>"()]+@[^@\s,;<>"()]+\.[^@\s,;<>"()]+$')]
 
-# Groq-optimized Pydantic models
-class GroqPatientData(BaseModel):
+class GroqPatientData(msgspec.Struct, kw_only=True):
     name: str
-    email: EmailStr
+    email: EmailAddress
     phone: Optional[str] = None
     symptoms: List[str]
     medical_history: Optional[str] = "No significant medical history reported."
@@ -52,13 +237,55 @@ class GroqPatientData(BaseModel):
     preferred_time: Optional[str] = None
     urgency_level: Optional[str] = "routine"
 
-class GroqMedicalAnalysisRequest(BaseModel):
+class GroqMedicalAnalysisRequest(msgspec.Struct, kw_only=True):
     symptoms: List[str]
     medical_history: Optional[str] = "No significant medical history."
     preferred_date: Optional[str] = None
     preferred_time: Optional[str] = None
     urgency_level: Optional[str] = "routine"
 
+_patient_decoder = msgspec.json.Decoder(GroqPatientData)
+_analysis_decoder = msgspec.json.Decoder(GroqMedicalAnalysisRequest)
+
+def _body_schema(struct_type: type) -> dict:
+    """OpenAPI requestBody for a msgspec body, since FastAPI cannot see it through Request"""
+    # The bodies are flat structs, so the component schema is inlined as is
+    _, components = msgspec.json.schema_components([struct_type])
+    return {"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": components[struct_type.__name__]}}
+    }}
+
+def _validation_errors(e: msgspec.DecodeError) -> list:
+    """Turn a msgspec error into FastAPI's 422 detail list, e.g.
+    "Expected `str`, got `int` - at `$.symptoms[0]`" -> loc ["body", "symptoms", 0]"""
+    message, at, path = str(e).rpartition(" - at `$")
+    if not at:
+        message, path = str(e), ""
+    loc = ["body"] + [key or int(index) for key, index in re.findall(r"\.(\w+)|\[(\d+)\]", path)]
+    if not isinstance(e, msgspec.ValidationError):
+        error_type = "json_invalid"
+    elif missing := re.match(r"Object missing required field `(\w+)`", message):
+        error_type = "missing"
+        loc.append(missing.group(1))
+    else:
+        error_type = "value_error"
+    return [{"loc": loc, "msg": message, "type": error_type}]
+
+async def _decode_body(http_request: Request, decoder: msgspec.json.Decoder):
+    """Decode a JSON request body, answering 422 when it is malformed or invalid"""
+    try:
+        body = decoder.decode(await http_request.body())
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=_validation_errors(e))
+    email = getattr(body, "email", None)
+    if email is not None:
+        try:
+            body.email = validate_email(email, check_deliverability=False).normalized
+        except EmailNotValidError as e:
+            raise HTTPException(status_code=422, detail=[{"loc": ["body", "email"], "msg": str(e), "type": "value_error"}])
+    return body
+
 # Groq API Endpoints
 
 @app.get("/")
@@ -66,7 +293,7 @@ async def root():
     return {
         "message": "Groq Healthcare AI API is running",
         "version": "3.0.0",
-        "llm_provider": "Groq (llama-3.1-70b-versatile)",
+        "llm_provider": LLM_PROVIDER,
         "email_fix": "Fixed - Emails sent to patient's email address",
         "features": [
             "Groq LLM Integration",
@@ -81,40 +308,47 @@ async def root():
             "/appointments",
             "/process-patient-groq",
             "/medical-analysis-groq",
-            "/email-logs"
+            "/email-logs",
+            "/task/{task_id}"
         ]
     }
 
+@lru_cache(maxsize=32)
+def _providers_payload(specialty: Optional[str]) -> bytes:
+    """Serialized /providers response; the provider table is static, so each filter is built once"""
+    providers_list = []
+    for spec, provider in HEALTHCARE_PROVIDERS.items():
+        if specialty and specialty not in spec.lower():
+            continue
+            
+        providers_list.append({
+            "id": spec,
+            "name": provider["name"],
+            "specialty": SPECIALTY_DISPLAY[spec],
+            "email": provider["email"],
+            "location": provider["location"],
+            "specializations": provider["specializations"],
+            "available_slots": provider.get("available_slots", []),
+            "rating": 4.8,
+            "nextAvailable": "Next Week",
+            "experience": "15+ years",
+            "groq_enabled": True
+        })
+    
+    return orjson.dumps({"providers": providers_list, "total": len(providers_list), "groq_ready": True})
+
 @app.get("/providers")
 async def get_groq_providers(specialty: Optional[str] = None):
     """Get healthcare providers optimized for Groq delivery"""
     try:
-        providers_list = []
-        for spec, provider in HEALTHCARE_PROVIDERS.items():
-            if specialty and specialty.lower() not in spec.lower():
-                continue
-                
-            providers_list.append({
-                "id": spec,
-                "name": provider["name"],
-                "specialty": spec.replace("_", " ").title(),
-                "email": provider["email"],
-                "location": provider["location"],
-                "specializations": provider["specializations"],
-                "available_slots": provider.get("available_slots", []),
-                "rating": 4.8,
-                "nextAvailable": "Next Week",
-                "experience": "15+ years",
-                "groq_enabled": True
-            })
-        
-        return {"providers": providers_list, "total": len(providers_list), "groq_ready": True}
+        return Response(_providers_payload(specialty.lower() if specialty else None), media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/process-patient-groq")
-async def process_patient_with_groq(patient_data: GroqPatientData, background_tasks: BackgroundTasks):
+@app.post("/process-patient-groq", openapi_extra=_body_schema(GroqPatientData))
+async def process_patient_with_groq(http_request: Request):
     """Enhanced patient processing with Groq and fixed email delivery"""
+    patient_data = await _decode_body(http_request, _patient_decoder)
     try:
         patient_id = str(uuid.uuid4())
         
@@ -130,100 +364,179 @@ async def process_patient_with_groq(patient_data: GroqPatientData, background_ta
             "urgency_level": patient_data.urgency_level
         }
         
-        # Store patient data
-        patients_db[patient_id] = patient_dict
-        
-        print(f"🚀 Groq processing started for: {patient_data.name}")
-        print(f"📧 Email will be sent to: {patient_data.email}")
+        logger.info("🚀 Groq processing started for: %s", patient_data.name)
+        logger.info("📧 Email will be sent to: %s", patient_data.email)
         
-        # Process in background with Groq
-        background_tasks.add_task(process_patient_groq_background, patient_id, patient_dict)
+        # Process on a Celery worker with Groq; the worker also stores the patient
+        # record, so the only Redis round trip left here is publishing the task
+        # to the broker, which runs in a thread to keep the event loop free
+        task = await asyncio.to_thread(process_patient_groq_task.delay, patient_id, patient_dict)
         
         return {
             "success": True,
             "patient_id": patient_id,
+            "task_id": task.id,
             "patient_email": patient_data.email,
             "message": f"Enhanced AI processing started with Groq. Medical report will be sent to {patient_data.email}",
             "status": "processing",
-            "llm_provider": "Groq (llama-3.1-70b-versatile)",
+            "llm_provider": LLM_PROVIDER,
             "email_fix": "Fixed - Will send to patient's email",
-            "features_used": [
-                "Medical History Analyst Agent (Groq)",
-                "Symptom Diagnostician Agent (Groq)", 
-                "Appointment Coordinator Agent (Groq)",
-                "Fixed Email Delivery to Patient",
-                "Comprehensive PDF Report"
-            ]
+            "features_used": PROCESSING_FEATURES
         }
         
     except Exception as e:
-        print(f"❌ Groq processing error: {str(e)}")
+        logger.error("❌ Groq processing error: %s", e)
         raise HTTPException(status_code=500, detail=f"Groq processing failed: {str(e)}")
 
+STORE_ATTEMPTS = 3
+
+async def _store_results(patient_id: str, patient_data: dict, results: dict):
+    """Write the appointment, report and email log for a completed pipeline run"""
+    # Celery workers have no lifespan ticker; one timestamp covers all three records
+    now = datetime.now()
+    now_iso = now.isoformat()
+    
+    # Appointments are booked days ahead, so the appointment (and the patient it
+    # names) is kept until the booked day is over, plus the usual retention
+    booking = results['appointment_details']
+    # The PDF is only kept in Redis (see below); records point at its key, not a file
+    pdf_bytes = results.get('pdf_bytes')
+    pdf_key = f"report_pdf:{patient_id}" if pdf_bytes else None
+    day_over = datetime.strptime(booking['date'], '%Y-%m-%d') + timedelta(days=1)
+    appointment_ttl = 0
+    if RECORD_TTL_SECONDS:
+        appointment_ttl = max(int((day_over - now).total_seconds()), 0) + RECORD_TTL_SECONDS
+        await store.expire(f"patient:{patient_id}", appointment_ttl)
+    await _save_record("appointment", patient_id, {
+        "patient_id": patient_id,
+        "appointment_details": booking,
+        "medical_analysis": results['medical_history_analysis'],
+        "clinical_assessment": results['clinical_assessment'],
+        "appointment_coordination": results['appointment_coordination'],
+        "report_pdf_key": pdf_key,
+        "urgency": results.get('urgency', 'routine'),
+        "status": "confirmed",
+        "email_sent": results.get('email_sent', False),
+        "email_status": results.get('email_status', ''),
+        "patient_email": patient_data['email'],  # Store patient email
+        "processing_summary": results.get('processing_summary', ''),
+        "llm_provider": "Groq",
+        "created_at": now_iso
+    }, ttl=appointment_ttl)
+    
+    # Store report info; reports expire along with the PDF's usefulness. The PDF itself
+    # is kept in Redis too, since the worker's disk is not visible to the API process
+    if pdf_key:
+        await store.set(pdf_key, pdf_bytes, ex=REPORT_TTL_SECONDS)
+    await _save_record("report", patient_id, {
+        "patient_id": patient_id,
+        "report_pdf_key": pdf_key,
+        "etag": f'"{hashlib.blake2b(pdf_bytes, digest_size=8).hexdigest()}"' if pdf_bytes else None,
+        "generated_at": now_iso,
+        "email_delivered": results.get('email_sent', False),
+        "patient_email": patient_data['email']
+    }, ttl=REPORT_TTL_SECONDS)
+    
+    # Index the confirmed slot for /available-slots; the sets expire once the day is over
+    async with store.pipeline(transaction=False) as pipe:
+        for booked_key in (f"booked:{booking['date']}:{booking['doctor']}", f"booked:{booking['date']}"):
+            pipe.sadd(booked_key, booking['time'])
+            pipe.expireat(booked_key, day_over)
+        await pipe.execute()
+    
+    # Log email delivery
+    await _save_record("email_log", patient_id, {
+        "patient_id": patient_id,
+        "patient_email": patient_data['email'],
+        "email_sent": results.get('email_sent', False),
+        "email_status": results.get('email_status', ''),
+        "llm_provider": "Groq",
+        "timestamp": now_iso
+    })
+    if results.get('email_sent', False):
+        await store.sadd(EMAIL_DELIVERED_KEY, patient_id)
+    else:
+        await store.srem(EMAIL_DELIVERED_KEY, patient_id)
+
 async def process_patient_groq_background(patient_id: str, patient_data: dict):
     """Enhanced background processing with Groq and fixed email"""
+    # A redelivered task for a patient whose results are already stored is not run again
+    if await store.hget(f"appointment:{patient_id}", "status") == orjson.dumps("confirmed"):
+        logger.info("⏭️ Groq processing already completed for: %s", patient_id)
+        return
+    
     try:
-        print(f"🤖 Starting Groq background processing for: {patient_id}")
-        print(f"📧 Target email: {patient_data['email']}")
-        
-        # Process through Groq crew system
-        results = healthcare_system.process_patient_with_auto_email(patient_data)
+        # Store patient data
+        await _save_record("patient", patient_id, patient_data)
         
-        # Store comprehensive results
-        if results['success']:
-            appointments_db[patient_id] = {
-                "patient_id": patient_id,
-                "appointment_details": results['appointment_details'],
-                "medical_analysis": results['medical_history_analysis'],
-                "clinical_assessment": results['clinical_assessment'],
-                "appointment_coordination": results['appointment_coordination'],
-                "pdf_report_path": results.get('pdf_report_path'),
-                "urgency": results.get('urgency', 'routine'),
-                "status": "confirmed",
-                "email_sent": results.get('email_sent', False),
-                "email_status": results.get('email_status', ''),
-                "patient_email": patient_data['email'],  # Store patient email
-                "processing_summary": results.get('processing_summary', ''),
-                "llm_provider": "Groq",
-                "created_at": datetime.now().isoformat()
-            }
-            
-            # Store report info
-            reports_db[patient_id] = {
-                "patient_id": patient_id,
-                "report_path": results.get('pdf_report_path'),
-                "generated_at": datetime.now().isoformat(),
-                "email_delivered": results.get('email_sent', False),
-                "patient_email": patient_data['email']
-            }
-            
-            # Log email delivery
-            email_logs[patient_id] = {
-                "patient_id": patient_id,
-                "patient_email": patient_data['email'],
-                "email_sent": results.get('email_sent', False),
-                "email_status": results.get('email_status', ''),
-                "llm_provider": "Groq",
-                "timestamp": datetime.now().isoformat()
-            }
-            
-        print(f"✅ Groq background processing completed for: {patient_id}")
+        logger.info("🤖 Starting Groq background processing for: %s", patient_id)
+        logger.info("📧 Target email: %s", patient_data['email'])
         
+        # Process through Groq crew system
+        results = await _get_healthcare_system().process_patient_with_auto_email_async(patient_data)
     except Exception as e:
-        print(f"❌ Groq background processing failed: {str(e)}")
+        logger.error("❌ Groq background processing failed: %s", e)
         # Store error info
-        appointments_db[patient_id] = {
+        await _save_record("appointment", patient_id, {
             "patient_id": patient_id,
             "status": "failed",
             "error": str(e),
             "patient_email": patient_data['email'],
             "llm_provider": "Groq",
             "created_at": datetime.now().isoformat()
-        }
+        })
+        return
+    
+    # Store comprehensive results. The crews have run and the email has gone out, so
+    # only this step is retried: a Redis hiccup must not re-send the email or re-book
+    if results['success']:
+        for attempt in range(1, STORE_ATTEMPTS + 1):
+            try:
+                await _store_results(patient_id, patient_data, results)
+                break
+            except redis.RedisError as e:
+                if attempt == STORE_ATTEMPTS:
+                    raise
+                logger.warning("⚠️ Storing results for %s failed (attempt %d): %s", patient_id, attempt, e)
+                await asyncio.sleep(2 ** attempt)
+    
+    logger.info("✅ Groq background processing completed for: %s", patient_id)
+
+# One event loop per Celery worker process, so the module's Redis client always
+# runs on the loop its connections were opened on
+_worker_loop = None
+
+@celery_app.task
+def process_patient_groq_task(patient_id: str, patient_data: dict) -> str:
+    """Celery entry point for the Groq background processing"""
+    global _worker_loop
+    if _worker_loop is None:
+        _worker_loop = asyncio.new_event_loop()
+    _worker_loop.run_until_complete(process_patient_groq_background(patient_id, patient_data))
+    return patient_id
+
+def _task_state(task_id: str) -> tuple:
+    """Read a task's state (and outcome once finished) from the result backend; blocking"""
+    result = AsyncResult(task_id, app=celery_app)
+    state = result.state
+    return state, result.result if state in ("SUCCESS", "FAILURE") else None
+
+@app.get("/task/{task_id}")
+async def get_groq_task_status(task_id: str):
+    """Poll the Celery task started by /process-patient-groq"""
+    # Celery's result backend client is synchronous, so it is queried off the event loop
+    state, outcome = await asyncio.to_thread(_task_state, task_id)
+    return {
+        "task_id": task_id,
+        "status": state,
+        "patient_id": outcome if state == "SUCCESS" else None,
+        "error": str(outcome) if state == "FAILURE" else None
+    }
 
-@app.post("/medical-analysis-groq")
-async def get_groq_medical_analysis(request: GroqMedicalAnalysisRequest):
+@app.post("/medical-analysis-groq", openapi_extra=_body_schema(GroqMedicalAnalysisRequest))
+async def get_groq_medical_analysis(http_request: Request):
     """Enhanced medical analysis with Groq"""
+    request = await _decode_body(http_request, _analysis_decoder)
     try:
         # Create Groq-compatible temporary patient data
         temp_patient = {
@@ -236,23 +549,37 @@ async def get_groq_medical_analysis(request: GroqMedicalAnalysisRequest):
             "urgency_level": request.urgency_level
         }
         
-        # Run Groq-optimized analysis
-        history_agent = healthcare_system.create_enhanced_medical_history_agent()
-        history_task = healthcare_system.create_comprehensive_medical_analysis_task(history_agent, temp_patient)
+        # Repeated requests with the same symptoms, history and urgency reuse the cached
+        # analysis; urgent and emergency cases always get a fresh run
+        cacheable = request.urgency_level not in ("urgent", "emergency")
+        cache_key = "analysis:" + hashlib.blake2b(orjson.dumps({
+            "s": sorted(request.symptoms),
+            "h": request.medical_history,
+            "u": request.urgency_level
+        }), digest_size=16).hexdigest()
+        cached_analysis = await store.get(cache_key) if cacheable else None
         
-        from crewai import Crew, Process
-        history_crew = Crew(agents=[history_agent], tasks=[history_task], process=Process.sequential)
-        analysis_result = history_crew.kickoff()
-        
-        # Determine recommended specialty and provider
-        symptom_text = " ".join(request.symptoms).lower()
-        best_specialty = "internal_medicine"
-        
-        for specialty, provider in HEALTHCARE_PROVIDERS.items():
-            if any(spec in symptom_text for spec in provider['specializations']):
-                best_specialty = specialty
-                break
+        if cached_analysis is not None:
+            analysis_result = cached_analysis.decode()
+        else:
+            # Run Groq-optimized analysis
+            # A fresh agent per request: kickoff sets the agent's crew and executor, so a
+            # shared one would mix up concurrent requests. Its LLM client is the shared one
+            healthcare_system = _get_healthcare_system()
+            history_agent = healthcare_system.create_enhanced_medical_history_agent()
+            history_task = healthcare_system.create_comprehensive_medical_analysis_task(history_agent, temp_patient)
+            
+            from crewai import Crew, Process
+            history_crew = Crew(agents=[history_agent], tasks=[history_task], process=Process.sequential)
+            # kickoff_async runs the crew on the executor thread pool, keeping the event loop free
+            analysis_result = _raw_output(await history_crew.kickoff_async())
+            # Unwrap fenced or prose-wrapped JSON the same way the Celery pipeline does
+            analysis_result = _extract_json(analysis_result) or analysis_result
+            if cacheable:
+                await store.setex(cache_key, ANALYSIS_CACHE_TTL_SECONDS, analysis_result)
         
+        # Determine recommended specialty and provider (same keyword index the scheduler uses)
+        best_specialty = determine_specialty(request.symptoms)
         recommended_provider = HEALTHCARE_PROVIDERS[best_specialty]
         
         # Groq-compatible scheduling note
@@ -262,34 +589,60 @@ async def get_groq_medical_analysis(request: GroqMedicalAnalysisRequest):
         
         return {
             "success": True,
-            "analysis": str(analysis_result),
-            "recommended_specialty": best_specialty.replace("_", " ").title(),
+            "analysis": analysis_result,
+            "recommended_specialty": SPECIALTY_DISPLAY[best_specialty],
             "recommended_provider": recommended_provider,
             "urgency": request.urgency_level,
             "scheduling_preferences": scheduling_note,
             "available_slots": recommended_provider.get("available_slots", []),
-            "llm_provider": "Groq (llama-3.1-70b-versatile)",
+            "llm_provider": LLM_PROVIDER,
             "groq_compatible": True,
-            "analysis_features": [
-                "Risk factor assessment (Groq)",
-                "Medication alerts (Groq)",
-                "Differential diagnosis (Groq)",
-                "Clinical correlation (Groq)",
-                "Urgency classification (Groq)",
-                "Fixed email delivery"
-            ]
+            "analysis_features": ANALYSIS_FEATURES
         }
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/appointments")
-async def get_all_groq_appointments():
-    """Get all appointments with Groq details"""
+async def get_all_groq_appointments(limit: int = Query(100, ge=1, le=500), offset: int = Query(0, ge=0)):
+    """
+    Get all appointments with Groq details.
+    
+    Pages follow the Redis SSCAN order of the appointment index, which is not
+    stable: appointments added or expired between requests (or a rehash of the
+    set) can shift entries, so a page may repeat or skip some. The totals and
+    rates always cover every appointment.
+    """
     try:
+        # A single pass over the index: the counters cover every appointment, only
+        # the flags they need are fetched, and just the requested page is loaded in full
+        total = groq_processed_count = emails_sent = 0
+        page_ids = []
+        async for batch in _scan_index("appointment"):
+            async with store.pipeline(transaction=False) as pipe:
+                for patient_id in batch:
+                    pipe.hmget(f"appointment:{patient_id}", "patient_id", "email_sent", "llm_provider")
+                rows = await pipe.execute()
+            expired = []
+            for patient_id, (stored_id, email_sent, llm_provider) in zip(batch, rows):
+                if stored_id is None:
+                    expired.append(patient_id)
+                    continue
+                if offset <= total < offset + limit:
+                    page_ids.append(patient_id)
+                total += 1
+                if email_sent is not None and orjson.loads(email_sent):
+                    emails_sent += 1
+                if llm_provider is None or orjson.loads(llm_provider) == 'Groq':
+                    groq_processed_count += 1
+            if expired:
+                await store.srem("appointments:index", *expired)
+        
+        appointments = await _load_records("appointment", page_ids)
+        patients = await _load_records("patient", page_ids)
         appointments_list = []
-        for patient_id, appt in appointments_db.items():
-            patient = patients_db.get(patient_id, {})
+        for patient_id, appt in appointments.items():
+            patient = patients.get(patient_id, {})
             appointment_details = appt.get('appointment_details', {})
             
             appointments_list.append({
@@ -313,9 +666,11 @@ async def get_all_groq_appointments():
         
         return {
             "appointments": appointments_list,
-            "total": len(appointments_list),
-            "groq_processed_count": sum(1 for a in appointments_list if a['llm_provider'] == 'Groq'),
-            "email_delivery_rate": sum(1 for a in appointments_list if a['email_sent']) / max(len(appointments_list), 1) * 100,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "groq_processed_count": groq_processed_count,
+            "email_delivery_rate": emails_sent / total * 100 if total else 0,
             "llm_provider": "Groq"
         }
         
@@ -326,25 +681,34 @@ async def get_all_groq_appointments():
 async def get_groq_email_logs():
     """Get email delivery logs with Groq processing"""
     try:
+        email_logs = await _load_all_records("email_log")
+        patients = await _load_records("patient", list(email_logs))
         logs_list = []
+        successful_deliveries = groq_processed = 0
         for patient_id, log in email_logs.items():
-            patient = patients_db.get(patient_id, {})
+            patient = patients.get(patient_id, {})
+            llm_provider = log.get('llm_provider', 'Groq')
+            if log['email_sent']:
+                successful_deliveries += 1
+            if llm_provider == 'Groq':
+                groq_processed += 1
             logs_list.append({
                 "patient_id": patient_id,
                 "patient_name": patient.get('name', 'Unknown'),
                 "patient_email": log['patient_email'],
                 "email_sent": log['email_sent'],
                 "email_status": log['email_status'],
-                "llm_provider": log.get('llm_provider', 'Groq'),
+                "llm_provider": llm_provider,
                 "timestamp": log['timestamp']
             })
         
+        total_emails = len(logs_list)
         return {
             "email_logs": logs_list,
-            "total_emails": len(logs_list),
-            "successful_deliveries": sum(1 for log in logs_list if log['email_sent']),
-            "delivery_rate": sum(1 for log in logs_list if log['email_sent']) / max(len(logs_list), 1) * 100,
-            "groq_processed": sum(1 for log in logs_list if log['llm_provider'] == 'Groq'),
+            "total_emails": total_emails,
+            "successful_deliveries": successful_deliveries,
+            "delivery_rate": successful_deliveries / total_emails * 100 if total_emails else 0,
+            "groq_processed": groq_processed,
             "llm_provider": "Groq",
             "email_fix": "Fixed - All emails sent to patient addresses"
         }
@@ -357,27 +721,14 @@ async def get_groq_available_slots(date: str, provider: Optional[str] = None):
     """Get available time slots with Groq compatibility"""
     try:
         # Get provider-specific slots if specified
-        if provider:
-            for specialty, prov_data in HEALTHCARE_PROVIDERS.items():
-                if prov_data["name"] == provider:
-                    base_slots = prov_data.get("available_slots", [
-                        "9:00 AM", "10:00 AM", "11:00 AM", "2:00 PM", "3:00 PM", "4:00 PM"
-                    ])
-                    break
-            else:
-                base_slots = ["9:00 AM", "10:00 AM", "11:00 AM", "2:00 PM", "3:00 PM", "4:00 PM"]
-        else:
-            base_slots = ["9:00 AM", "10:00 AM", "11:00 AM", "2:00 PM", "3:00 PM", "4:00 PM"]
+        spec, prov_data = PROVIDERS_BY_NAME.get(provider, (None, None))
+        base_slots = prov_data.get("available_slots", DEFAULT_SLOTS) if prov_data else DEFAULT_SLOTS
         
-        # Filter out booked slots
-        available_slots = base_slots.copy()
-        
-        for appt in appointments_db.values():
-            appt_details = appt.get("appointment_details", {})
-            if appt_details.get("date") == date and appt.get("status") == "confirmed":
-                booked_time = appt_details.get("time")
-                if booked_time in available_slots:
-                    available_slots.remove(booked_time)
+        # Filter out booked slots: one SMISMEMBER against the per-day (and per-provider)
+        # booking set flags exactly the base slots, in order
+        booked_key = f"booked:{date}:{provider}" if provider else f"booked:{date}"
+        booked_flags = await store.smismember(booked_key, list(base_slots))
+        available_slots = [slot for slot, booked in zip(base_slots, booked_flags) if not booked]
         
         return {
             "success": True,
@@ -392,42 +743,60 @@ async def get_groq_available_slots(date: str, provider: Optional[str] = None):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/reports/{patient_id}")
-async def get_groq_medical_report(patient_id: str):
+async def get_groq_medical_report(patient_id: str, if_none_match: Optional[str] = Header(None)):
     """Download Groq-generated medical report PDF"""
     try:
-        if patient_id not in reports_db:
+        report_info = await _load_record("report", patient_id)
+        if report_info is None:
             raise HTTPException(status_code=404, detail="Groq medical report not found")
         
-        report_info = reports_db[patient_id]
-        pdf_path = report_info["report_path"]
+        etag = report_info.get("etag")
+        cache_headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"} if etag else {}
+        if etag and if_none_match == etag:
+            return Response(status_code=304, headers=cache_headers)
         
-        if not os.path.exists(pdf_path):
+        # Written by the Celery worker, which may run on another host than the API
+        pdf_bytes = await store.get(f"report_pdf:{patient_id}")
+        if pdf_bytes is None:
             raise HTTPException(status_code=404, detail="Report file not found")
         
-        return FileResponse(
-            path=pdf_path,
-            filename=f"groq_medical_report_{patient_id}.pdf",
-            media_type="application/pdf"
+        return Response(
+            content=pdf_bytes,
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": f'attachment; filename="groq_medical_report_{patient_id}.pdf"',
+                **cache_headers
+            }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/system/health")
 async def groq_health_check():
     """Groq system health check"""
+    # Index sizes, read in one round trip; ids that expired since the last prune
+    # are still counted until the pruning job drops them
+    async with store.pipeline(transaction=False) as pipe:
+        for kind in ("patient", "appointment", "report", "email_log"):
+            pipe.scard(f"{kind}s:index")
+        pipe.scard(EMAIL_DELIVERED_KEY)
+        patients_count, appointments_count, reports_count, emails_sent, emails_delivered = await pipe.execute()
     return {
         "status": "healthy",
         "version": "3.0.0",
-        "llm_provider": "Groq (llama-3.1-70b-versatile)",
+        "llm_provider": LLM_PROVIDER,
         "email_fix": "Fixed - Emails sent to patient addresses",
-        "timestamp": datetime.now().isoformat(),
-        "patients_count": len(patients_db),
-        "appointments_count": len(appointments_db),
-        "reports_count": len(reports_db),
-        "emails_sent": len(email_logs),
-        "email_delivery_rate": sum(1 for log in email_logs.values() if log['email_sent']) / max(len(email_logs), 1) * 100,
-        "groq_processed": sum(1 for log in email_logs.values() if log.get('llm_provider') == 'Groq'),
+        "timestamp": _NOW_ISO,
+        "patients_count": patients_count,
+        "appointments_count": appointments_count,
+        "reports_count": reports_count,
+        "emails_sent": emails_sent,
+        "email_delivery_rate": emails_delivered / emails_sent * 100 if emails_sent else 0,
+        # Every email log is written by the Groq pipeline
+        "groq_processed": emails_sent,
         "features": [
             "Groq LLM Integration",
             "Fixed Email Delivery to Patient", 
@@ -440,24 +809,20 @@ async def groq_health_check():
 @app.post("/system/reset")
 async def reset_groq_system():
     """Reset all Groq system data"""
-    global appointments_db, patients_db, reports_db, email_logs
-    appointments_db.clear()
-    patients_db.clear()
-    reports_db.clear()
-    email_logs.clear()
+    await store.flushdb()
     
     return {
         "success": True,
         "message": "Groq system data reset successfully",
         "llm_provider": "Groq",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": _NOW_ISO
     }
 
 if __name__ == "__main__":
     import uvicorn
     print("🚀 Starting Groq Healthcare AI FastAPI Server...")
     print("✨ New Features:")
-    print("   - Groq LLM Integration (llama-3.1-70b-versatile)")
+    print(f"   - Groq LLM Integration ({LLM_MODEL})")
     print("   - FIXED: Email delivery to patient's email address")
     print("   - Enhanced AI Medical Analysis")
     print("   - Date/Time Preferences")
@@ -469,6 +834,8 @@ if __name__ == "__main__":
     print("   - GET  /email-logs")
     print("   - GET  /providers (Groq ready)")
     print("   - GET  /appointments (Groq enhanced)")
+    print("   - GET  /task/{task_id}")
+    print("\n⚙️  Celery worker: celery -A emailjs_main worker --concurrency=8 --pool=prefork")
     print("\n🌐 Server: http://localhost:8000")
     print("📚 API Docs: http://localhost:8000/docs")
     print("\n🔧 Required Environment Variables:")
@@ -476,9 +843,13 @@ if __name__ == "__main__":
     print("   - EMAIL_ADDRESS (your Gmail address)")
     print("   - EMAIL_APP_PASSWORD (Gmail app password)")
     
+    # State lives in Redis, so requests can be spread over one worker process per core;
+    # uvloop and httptools (C-backed event loop and HTTP parser) must be installed
     uvicorn.run(
-        "groq_main:app",
+        "emailjs_main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True
+        workers=os.cpu_count(),
+        loop="uvloop",
+        http="httptools"
     )
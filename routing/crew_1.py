@@ -1,34 +1,77 @@
 from crewai import Agent, Task, Crew, Process
 from crewai.tools import tool
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage
 import os
 import re
+import sys
 import webbrowser
 import tempfile
 import json
-import base64
+import logging
+import logging.handlers
+import orjson
+import html
+import hashlib
+import httpx
+import sqlite3
+import time
+import threading
+import types
+from collections import OrderedDict
+from functools import lru_cache
+from string import Template
+from urllib.parse import quote
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
 
-# Import the specific agents and tasks
-from EmergencyAgent.agents import emergency_agent
-from EmergencyAgent.tasks import create_firstaid_task
-from HistoryAgent.agents import medical_history_agent
-from HistoryAgent.task import create_history_analysis_task
-from SymptomAgent.agents import create_symptom_checker_agent
-from SymptomAgent.task import create_diagnosis_task
-from SymptomAgent.tools import get_diseases_from_neo4j, get_all_symptoms_from_neo4j, close_driver
-from HistoryAgent.pdf_generator import generate_medical_report_pdf
+# langchain, reportlab and the agent packages (which load langchain_openai,
+# reportlab and the first-aid PDF search tool when imported) are imported in the
+# handlers that use them, so the interactive menu comes up without loading them
+if TYPE_CHECKING:
+    from langchain_openai import ChatOpenAI
 
 load_dotenv()
 
-# Healthcare providers database
+LLM_MODEL = "gpt-3.5-turbo"
+
+# CrewAI's step-by-step agent output is opt-in
+AGENT_VERBOSE = os.getenv("HEALTHCARE_AGENT_VERBOSE", "").lower() in ("1", "true", "yes")
+
+# Progress lines from process_patient are buffered and written together when the
+# patient is done (or straight away on an error) instead of one stdout write per step
+logger = logging.getLogger(__name__)
+_log_stream = logging.StreamHandler(sys.stdout)
+_log_stream.setFormatter(logging.Formatter("%(message)s"))
+_log_buffer = logging.handlers.MemoryHandler(capacity=100, flushLevel=logging.ERROR, target=_log_stream)
+logger.addHandler(_log_buffer)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# One keep-alive connection pool shared by every ChatOpenAI client in this module
+_HTTP_CLIENT = httpx.Client(limits=httpx.Limits(max_keepalive_connections=20, max_connections=50))
+
+@lru_cache(maxsize=None)
+def get_shared_llm(temperature: float = 0.3, max_tokens: int = None) -> "ChatOpenAI":
+    """Return the process-wide ChatOpenAI client for the given sampling settings"""
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(openai_api_key=os.getenv("OPENAI_API_KEY"), model=LLM_MODEL,
+                      temperature=temperature, max_tokens=max_tokens, http_client=_HTTP_CLIENT)
+
+# Exact-match cache for extract_medical_features (in-process LRU backed by SQLite).
+# The entries are patient-derived, so the database lives in a private per-user
+# cache directory rather than the working directory
+FEATURE_TEMPERATURE = 0.3
+FEATURE_MAX_TOKENS = 400
+FEATURE_CACHE_DB = os.getenv("FEATURE_CACHE_DB", os.path.join(
+    os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "diagnowise", "medical_features_cache.sqlite3"))
+FEATURE_CACHE_TTL = 86400  # seconds
+FEATURE_CACHE_PURGE_EVERY = 100  # writes between deletions of expired rows
+FEATURE_MEMORY_SIZE = 1024
+
+# Healthcare providers database (frozen below)
 HEALTHCARE_PROVIDERS = {
     "cardiology": {
         "name": "Dr. Rajesh Sharma", 
@@ -56,11 +99,233 @@ HEALTHCARE_PROVIDERS = {
     }
 }
 
-@tool
-def extract_medical_features(medical_history: str) -> dict:
-    """Extract medical features from patient history using LLM"""
-    openai_api_key = os.getenv("OPENAI_API_KEY")
-    llm = ChatOpenAI(openai_api_key=openai_api_key, model="gpt-3.5-turbo", temperature=0.3, max_tokens=400)
+# Rendered once for the scheduling prompt, then frozen against accidental mutation
+_PROVIDERS_TEXT = json.dumps(HEALTHCARE_PROVIDERS, indent=2)
+HEALTHCARE_PROVIDERS = types.MappingProxyType({
+    specialty: types.MappingProxyType({**provider, 'specializations': tuple(provider['specializations'])})
+    for specialty, provider in HEALTHCARE_PROVIDERS.items()
+})
+
+# Keyword -> specialty index built once. Keywords keep provider order and a
+# keyword shared by several providers maps to the first one, so the first
+# keyword found in the symptoms gives the same answer as scanning providers.
+_SPEC_INDEX = {}
+for _specialty, _provider in HEALTHCARE_PROVIDERS.items():
+    for _keyword in _provider['specializations']:
+        _SPEC_INDEX.setdefault(_keyword, _specialty)
+_SPEC_KEYWORDS = tuple(_SPEC_INDEX)  # insertion order = priority
+
+_URGENCY_RE = re.compile(r'EMERGENCY|URGENT', re.IGNORECASE)
+
+# Fixed task instructions. Each task description starts with its block so the
+# prompt prefix is byte-identical across patients and eligible for provider-side
+# prompt prefix caching; only the patient-specific tail differs per request.
+MEDICAL_HISTORY_INSTRUCTIONS = """
+            Analyze the comprehensive medical profile given at the end of this task.
+            
+            Provide detailed analysis including:
+            1. Risk factor identification and assessment
+            2. Medication alerts and contraindications
+            3. Clinical correlation between history and current symptoms
+            4. Comprehensive medical summary with recommendations
+            
+            Return structured JSON format for integration.
+            """
+
+SYMPTOM_ANALYSIS_INSTRUCTIONS = """
+            Perform a clinical symptom assessment for the patient given at the end of this task.
+            
+            Provide:
+            1. Differential diagnosis considerations
+            2. Urgency classification (EMERGENCY/URGENT/ROUTINE)
+            3. Recommended specialist type and rationale
+            4. Clinical correlation with medical history
+            5. Immediate care recommendations
+            
+            Consider both current symptoms and historical medical context.
+            """
+
+SCHEDULING_INSTRUCTIONS = f"""
+            Coordinate a healthcare appointment for the patient given at the end of this task.
+            
+            Available Providers: {_PROVIDERS_TEXT}
+            
+            Determine:
+            1. Most appropriate healthcare provider match
+            2. Optimal appointment timing based on urgency
+            3. Pre-appointment preparation requirements
+            4. Follow-up care coordination needs
+            
+            Provide structured appointment coordination plan.
+            """
+
+# Email interface page, split around the streamed PDF attachment block.
+# Values are escaped/quoted by create_web_email_interface before substitution.
+EMAIL_PAGE_HEAD = Template("""
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Healthcare Email System</title>
+    <style>
+        body { font-family: 'Segoe UI', sans-serif; background: linear-gradient(135deg, #667eea, #764ba2); 
+               min-height: 100vh; padding: 20px; }
+        .container { max-width: 900px; margin: 0 auto; background: white; border-radius: 15px; 
+                     box-shadow: 0 20px 40px rgba(0,0,0,0.1); overflow: hidden; }
+        .header { background: linear-gradient(45deg, #2196F3, #21CBF3); color: white; padding: 30px; text-align: center; }
+        .content { padding: 30px; }
+        .email-preview { background: #f8f9fa; border: 2px solid #e9ecef; border-radius: 8px; 
+                         padding: 20px; margin: 20px 0; max-height: 400px; overflow-y: auto; }
+        .attachment-section { background: #e8f5e8; padding: 15px; border-radius: 8px; margin: 15px 0; 
+                              border: 2px solid #4CAF50; }
+        .form-group { margin: 15px 0; }
+        label { display: block; margin-bottom: 5px; font-weight: 600; color: #333; }
+        input { width: 100%; padding: 12px; border: 2px solid #ddd; border-radius: 8px; }
+        .btn { padding: 12px 20px; border: none; border-radius: 8px; font-weight: 600; 
+               cursor: pointer; text-decoration: none; display: inline-block; margin: 5px; }
+        .btn-primary { background: #2196F3; color: white; }
+        .btn-success { background: #4CAF50; color: white; }
+        .btn-warning { background: #FF9800; color: white; }
+        .btn-group { display: flex; gap: 10px; flex-wrap: wrap; margin: 20px 0; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🏥 Advanced Healthcare Email System</h1>
+            <p>Comprehensive Medical Report & Appointment Management</p>
+        </div>
+        
+        <div class="content">
+            <div class="form-group">
+                <label>📧 Patient Email:</label>
+                <input type="email" value="$patient_email" readonly>
+            </div>
+            
+            <div class="form-group">
+                <label>📋 Subject:</label>
+                <input type="text" value="$subject" readonly>
+            </div>
+            """)
+
+EMAIL_PAGE_TAIL = Template("""
+            
+            <div class="form-group">
+                <label>💌 Email Content:</label>
+                <div class="email-preview">$body_html</div>
+            </div>
+            
+            <div class="btn-group">
+                <a href="$gmail_url" 
+                   target="_blank" class="btn btn-primary">📧 Send via Gmail</a>
+                <a href="$mailto_url" class="btn btn-warning">📧 Default Email</a>
+                <button onclick="copyContent()" class="btn btn-success">📋 Copy All Content</button>
+            </div>
+        </div>
+    </div>
+    
+    <script>
+        function copyContent() {
+            const content = $copy_text;
+            navigator.clipboard.writeText(content).then(() => {
+                alert('📋 Email content copied to clipboard!');
+            });
+        }
+        setTimeout(() => {
+            document.querySelector('a[href*="gmail"]').click();
+        }, 2000);
+    </script>
+</body>
+</html>""")
+
+def _feature_cache_key(medical_history: str) -> str:
+    """SHA256 signature of the normalized history plus the model settings"""
+    signature = f"{LLM_MODEL}|{FEATURE_TEMPERATURE}|{FEATURE_MAX_TOKENS}|{medical_history.strip().lower()}"
+    return hashlib.sha256(signature.encode('utf-8')).hexdigest()
+
+# SQLite connections may not cross threads, so each thread keeps its own open;
+# the schema is created once per process, by whichever thread connects first
+_feature_cache_local = threading.local()
+_feature_cache_schema_lock = threading.Lock()
+_feature_cache_schema_ready = False
+_feature_cache_writes = 0
+
+def _feature_cache_purge(conn: sqlite3.Connection):
+    """Delete expired rows, so stale patient analyses don't stay on disk"""
+    with conn:
+        conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - FEATURE_CACHE_TTL,))
+
+def _feature_cache_connect() -> sqlite3.Connection:
+    global _feature_cache_schema_ready
+    conn = getattr(_feature_cache_local, 'conn', None)
+    if conn is not None:
+        return conn
+    with _feature_cache_schema_lock:
+        if not _feature_cache_schema_ready:
+            cache_dir = os.path.dirname(FEATURE_CACHE_DB)
+            if cache_dir:
+                os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+            with sqlite3.connect(FEATURE_CACHE_DB) as setup:
+                setup.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT, created_at REAL)")
+            _feature_cache_purge(setup)
+            setup.close()
+            _feature_cache_schema_ready = True
+    conn = _feature_cache_local.conn = sqlite3.connect(FEATURE_CACHE_DB)
+    return conn
+
+def _feature_cache_get(key: str):
+    """Return (response, created_at) for an unexpired SQLite entry, else None"""
+    row = _feature_cache_connect().execute(
+        "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+    ).fetchone()
+    if row and time.time() - row[1] < FEATURE_CACHE_TTL:
+        return row
+    return None
+
+def _feature_cache_set(key: str, response: str):
+    global _feature_cache_writes
+    conn = _feature_cache_connect()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                     (key, response, time.time()))
+    # The counter is only a rough schedule, so racing increments don't matter
+    _feature_cache_writes += 1
+    if _feature_cache_writes % FEATURE_CACHE_PURGE_EVERY == 0:
+        _feature_cache_purge(conn)
+
+# In-process LRU in front of SQLite: key -> (response, created_at), oldest first.
+# Entries carry their SQLite timestamp so the TTL applies at both layers
+_feature_memory = OrderedDict()
+_feature_memory_lock = threading.Lock()
+
+def _feature_memory_put(key: str, response: str, created_at: float):
+    with _feature_memory_lock:
+        _feature_memory[key] = (response, created_at)
+        _feature_memory.move_to_end(key)
+        if len(_feature_memory) > FEATURE_MEMORY_SIZE:
+            _feature_memory.popitem(last=False)
+
+def _analyze_medical_history(cache_key: str, medical_history: str) -> str:
+    """Cached LLM analysis; failures raise so they are never cached"""
+    with _feature_memory_lock:
+        hit = _feature_memory.get(cache_key)
+        if hit is not None:
+            if time.time() - hit[1] < FEATURE_CACHE_TTL:
+                _feature_memory.move_to_end(cache_key)
+                return hit[0]
+            del _feature_memory[cache_key]
+    
+    # The SQLite layer fails open: an unusable database only costs the LLM call
+    try:
+        cached = _feature_cache_get(cache_key)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("Feature cache read failed, calling the LLM: %s", e)
+        cached = None
+    if cached is not None:
+        _feature_memory_put(cache_key, *cached)
+        return cached[0]
+    
+    llm = get_shared_llm(FEATURE_TEMPERATURE, FEATURE_MAX_TOKENS)
     
     prompt = f"""
     Analyze this medical history and extract:
@@ -74,29 +339,80 @@ def extract_medical_features(medical_history: str) -> dict:
     {{"risk_factors": [...], "medication_alerts": [...], "summary": "..."}}
     """
     
+    from langchain.schema import HumanMessage
+    response = llm.invoke([HumanMessage(content=prompt)])
+    result = orjson.dumps(orjson.loads(response.content), option=orjson.OPT_INDENT_2).decode()
     try:
-        response = llm.invoke([HumanMessage(content=prompt)])
-        result = json.loads(response.content)
-        return json.dumps(result, indent=2)
+        _feature_cache_set(cache_key, result)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning("Feature cache write failed: %s", e)
+    _feature_memory_put(cache_key, result, time.time())
+    return result
+
+_FEATURES_UNAVAILABLE = orjson.dumps(
+    {"risk_factors": [], "medication_alerts": [], "summary": "Analysis unavailable"}
+).decode()
+
+@tool
+def extract_medical_features(medical_history: str) -> dict:
+    """Extract medical features from patient history using LLM"""
+    try:
+        return _analyze_medical_history(_feature_cache_key(medical_history), medical_history.strip())
     except:
-        return json.dumps({"risk_factors": [], "medication_alerts": [], "summary": "Analysis unavailable"})
+        return _FEATURES_UNAVAILABLE
 
 class MedicalReportGenerator:
+    _style_cache = None
+    
+    @classmethod
+    def _styles(cls) -> dict:
+        """Build the stylesheet, paragraph styles and table styles once per process"""
+        if cls._style_cache is None:
+            from reportlab.platypus import TableStyle
+            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+            from reportlab.lib import colors
+            styles = getSampleStyleSheet()
+            cls._style_cache = {
+                'normal': styles['Normal'],
+                'title': ParagraphStyle('CustomTitle', parent=styles['Heading1'], 
+                                        fontSize=18, spaceAfter=30, textColor=colors.darkblue, alignment=1),
+                'heading': ParagraphStyle('CustomHeading', parent=styles['Heading2'], 
+                                          fontSize=14, spaceAfter=12, textColor=colors.darkred),
+                'footer': ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, 
+                                         textColor=colors.grey, alignment=1),
+                'info_table': TableStyle([
+                    ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 0), (-1, -1), 10),
+                    ('ALIGN', (0, 0), (-1, -1), 'LEFT')
+                ]),
+                'appt_table': TableStyle([
+                    ('BACKGROUND', (0, 0), (0, -1), colors.lightgreen),
+                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+                    ('FONTSIZE', (0, 0), (-1, -1), 10)
+                ]),
+            }
+        return cls._style_cache
+    
     @staticmethod
-    def generate_pdf_report(patient_data: dict, medical_analysis: str, appointment_details: dict) -> str:
+    def generate_pdf_report(patient_data: dict, medical_analysis: str, appointment_details: dict,
+                            now: datetime = None, timestamp: str = None) -> str:
         """Generate comprehensive medical PDF report"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        from reportlab.lib.pagesizes import letter
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+        from reportlab.lib.units import inch
+        
+        now = now or datetime.now()
+        timestamp = timestamp or now.strftime("%Y%m%d_%H%M%S")
         filename = f"medical_report_{patient_data['name'].replace(' ', '_')}_{timestamp}.pdf"
         
-        doc = SimpleDocTemplate(filename, pagesize=letter, topMargin=0.5*inch)
         story = []
-        styles = getSampleStyleSheet()
-        
-        # Custom styles
-        title_style = ParagraphStyle('CustomTitle', parent=styles['Heading1'], 
-                                   fontSize=18, spaceAfter=30, textColor=colors.darkblue, alignment=1)
-        heading_style = ParagraphStyle('CustomHeading', parent=styles['Heading2'], 
-                                     fontSize=14, spaceAfter=12, textColor=colors.darkred)
+        cached = MedicalReportGenerator._styles()
+        normal_style = cached['normal']
+        title_style = cached['title']
+        heading_style = cached['heading']
         
         # Title and header
         story.append(Paragraph("COMPREHENSIVE MEDICAL REPORT", title_style))
@@ -106,57 +422,51 @@ class MedicalReportGenerator:
         patient_info = [
             ['Patient Name:', patient_data['name']],
             ['Email:', patient_data['email']],
-            ['Report Date:', datetime.now().strftime("%B %d, %Y")],
+            ['Report Date:', now.strftime("%B %d, %Y")],
             ['Appointment ID:', appointment_details['appointment_id']]
         ]
         
         info_table = Table(patient_info, colWidths=[2*inch, 4*inch])
-        info_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT')
-        ]))
+        info_table.setStyle(cached['info_table'])
         story.append(info_table)
         story.append(Spacer(1, 20))
         
         # Current symptoms
         story.append(Paragraph("PRESENTING SYMPTOMS", heading_style))
         for i, symptom in enumerate(patient_data['symptoms'], 1):
-            story.append(Paragraph(f"{i}. {symptom}", styles['Normal']))
+            story.append(Paragraph(f"{i}. {symptom}", normal_style))
         story.append(Spacer(1, 15))
         
         # Medical analysis
         try:
-            analysis_data = json.loads(medical_analysis) if isinstance(medical_analysis, str) else medical_analysis
+            analysis_data = orjson.loads(medical_analysis) if isinstance(medical_analysis, str) else medical_analysis
             
             # Risk factors
             story.append(Paragraph("IDENTIFIED RISK FACTORS", heading_style))
             if analysis_data.get('risk_factors'):
                 for risk in analysis_data['risk_factors']:
-                    story.append(Paragraph(f"• {risk}", styles['Normal']))
+                    story.append(Paragraph(f"• {risk}", normal_style))
             else:
-                story.append(Paragraph("No specific risk factors identified from available information.", styles['Normal']))
+                story.append(Paragraph("No specific risk factors identified from available information.", normal_style))
             story.append(Spacer(1, 15))
             
             # Medication alerts
             story.append(Paragraph("MEDICATION ALERTS", heading_style))
             if analysis_data.get('medication_alerts'):
                 for alert in analysis_data['medication_alerts']:
-                    story.append(Paragraph(f"⚠️ {alert}", styles['Normal']))
+                    story.append(Paragraph(f"⚠️ {alert}", normal_style))
             else:
-                story.append(Paragraph("No medication alerts identified.", styles['Normal']))
+                story.append(Paragraph("No medication alerts identified.", normal_style))
             story.append(Spacer(1, 15))
             
             # Clinical summary
             story.append(Paragraph("CLINICAL ASSESSMENT", heading_style))
             summary = analysis_data.get('summary', 'No summary available')
-            story.append(Paragraph(summary, styles['Normal']))
+            story.append(Paragraph(summary, normal_style))
             
         except:
             story.append(Paragraph("MEDICAL ANALYSIS", heading_style))
-            story.append(Paragraph(str(medical_analysis), styles['Normal']))
+            story.append(Paragraph(str(medical_analysis), normal_style))
         
         story.append(Spacer(1, 20))
         
@@ -171,27 +481,23 @@ class MedicalReportGenerator:
         ]
         
         appt_table = Table(appt_info, colWidths=[2*inch, 4*inch])
-        appt_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (0, -1), colors.lightgreen),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10)
-        ]))
+        appt_table.setStyle(cached['appt_table'])
         story.append(appt_table)
         
         # Footer
         story.append(Spacer(1, 30))
-        footer_style = ParagraphStyle('Footer', parent=styles['Normal'], fontSize=8, 
-                                    textColor=colors.grey, alignment=1)
-        story.append(Paragraph("AI-Generated Medical Report - For Healthcare Professional Review", footer_style))
+        story.append(Paragraph("AI-Generated Medical Report - For Healthcare Professional Review", cached['footer']))
         
-        doc.build(story)
+        # Write through a large buffer instead of many small flushes
+        with open(filename, 'wb', buffering=1 << 20) as pdf_file:
+            doc = SimpleDocTemplate(pdf_file, pagesize=letter, topMargin=0.5*inch)
+            doc.build(story)
         return filename
 
 class HealthcareRoutingSystem:
     def __init__(self):
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
-        self.llm = ChatOpenAI(model="gpt-3.5-turbo", openai_api_key=self.openai_api_key, temperature=0.3)
+        self.llm = get_shared_llm(0.3)
         self.report_generator = MedicalReportGenerator()
     
     def display_main_menu(self):
@@ -231,7 +537,7 @@ class HealthcareRoutingSystem:
                      "medication interactions, and provides clinical summaries for healthcare providers.",
             tools=[extract_medical_features],
             llm=self.llm,
-            verbose=True,
+            verbose=AGENT_VERBOSE,
             allow_delegation=False
         )
     
@@ -242,18 +548,7 @@ class HealthcareRoutingSystem:
             backstory="Advanced diagnostic AI that evaluates presenting symptoms, determines urgency levels, "
                      "and recommends appropriate specialist referrals based on clinical presentation.",
             llm=self.llm,
-            verbose=True,
-            allow_delegation=False
-        )
-    
-    def create_appointment_scheduler(self) -> Agent:
-        return Agent(
-            role="Healthcare Appointment Coordinator",
-            goal="Match patients with appropriate specialists and optimize appointment scheduling",
-            backstory="Intelligent scheduling system that considers symptom urgency, specialist availability, "
-                     "and patient needs to coordinate optimal healthcare appointments.",
-            llm=self.llm,
-            verbose=True,
+            verbose=AGENT_VERBOSE,
             allow_delegation=False
         )
     
@@ -261,327 +556,31 @@ class HealthcareRoutingSystem:
         medical_history = patient_data.get('medical_history', 'No previous medical history provided.')
         
         return Task(
-            description=f"""
-            Analyze comprehensive medical profile for: {patient_data['name']}
-            
+            description=MEDICAL_HISTORY_INSTRUCTIONS + f"""
+            Patient: {patient_data['name']}
             Current Symptoms: {', '.join(patient_data['symptoms'])}
             Medical History: {medical_history}
-            
-            Provide detailed analysis including:
-            1. Risk factor identification and assessment
-            2. Medication alerts and contraindications
-            3. Clinical correlation between history and current symptoms
-            4. Comprehensive medical summary with recommendations
-            
-            Return structured JSON format for integration.
             """,
             agent=agent,
             expected_output="Comprehensive medical analysis in JSON format with risk factors, alerts, and clinical summary"
         )
     
-    def create_symptom_analysis_task(self, agent: Agent, patient_data: dict, history_analysis: str) -> Task:
+    def create_symptom_analysis_task(self, agent: Agent, patient_data: dict, history_analysis: str = None,
+                                     context: list = None) -> Task:
+        # With context= the history analysis is injected by CrewAI instead of interpolated
+        if history_analysis is None:
+            history_analysis = "See the medical history analysis in the task context."
         return Task(
-            description=f"""
-            Clinical symptom assessment for: {patient_data['name']}
-            
+            description=SYMPTOM_ANALYSIS_INSTRUCTIONS + f"""
+            Patient: {patient_data['name']}
             Presenting Symptoms: {', '.join(patient_data['symptoms'])}
             Medical History Analysis: {history_analysis}
-            
-            Provide:
-            1. Differential diagnosis considerations
-            2. Urgency classification (EMERGENCY/URGENT/ROUTINE)
-            3. Recommended specialist type and rationale
-            4. Clinical correlation with medical history
-            5. Immediate care recommendations
-            
-            Consider both current symptoms and historical medical context.
             """,
             agent=agent,
+            context=context,
             expected_output="Clinical assessment with urgency level and specialist recommendation"
         )
     
-    def create_scheduling_task(self, agent: Agent, patient_data: dict, clinical_assessment: str) -> Task:
-        return Task(
-            description=f"""
-            Coordinate healthcare appointment for: {patient_data['name']}
-            
-            Clinical Assessment: {clinical_assessment}
-            Available Providers: {HEALTHCARE_PROVIDERS}
-            
-            Determine:
-            1. Most appropriate healthcare provider match
-            2. Optimal appointment timing based on urgency
-            3. Pre-appointment preparation requirements
-            4. Follow-up care coordination needs
-            
-            Provide structured appointment coordination plan.
-            """,
-            agent=agent,
-            expected_output="Detailed appointment coordination with provider matching and timing recommendations"
-        )
-    
-    def determine_specialty(self, symptoms: list) -> str:
-        symptom_text = " ".join(symptoms).lower()
-        for specialty, provider in HEALTHCARE_PROVIDERS.items():
-            if any(spec in symptom_text for spec in provider['specializations']):
-                return specialty
-        return "internal_medicine"
-    
-    def generate_appointment_details(self, specialty: str, patient_name: str, urgency: str = "routine") -> dict:
-        provider = HEALTHCARE_PROVIDERS.get(specialty, HEALTHCARE_PROVIDERS['internal_medicine'])
-        
-        if urgency.lower() == "emergency":
-            date = datetime.now().strftime('%Y-%m-%d')
-            time = "IMMEDIATE - Emergency Department"
-        elif urgency.lower() == "urgent":
-            date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
-            time = "09:00 AM"
-        else:
-            date = (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d')
-            time = "10:00 AM"
-        
-        return {
-            'patient': patient_name,
-            'doctor': provider['name'],
-            'specialty': specialty.replace('_', ' ').title(),
-            'date': date,
-            'time': time,
-            'location': provider['location'],
-            'doctor_email': provider['email'],
-            'appointment_id': f"APPT_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        }
-    
-    def create_web_email_interface(self, patient_email: str, subject: str, body: str, pdf_path: str = None) -> str:
-        """Enhanced email interface with PDF attachment support"""
-        
-        pdf_attachment_html = ""
-        if pdf_path and os.path.exists(pdf_path):
-            with open(pdf_path, 'rb') as f:
-                pdf_base64 = base64.b64encode(f.read()).decode()
-            pdf_attachment_html = f'''
-            <div class="attachment-section">
-                <h3>📎 Medical Report Attachment</h3>
-                <a href="data:application/pdf;base64,{pdf_base64}" download="medical_report.pdf" 
-                   class="btn btn-success">📄 Download Medical Report</a>
-            </div>'''
-        
-        body_html = body.replace('\n', '<br>').replace('"', '&quot;')
-        
-        html_content = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>Healthcare Email System</title>
-    <style>
-        body {{ font-family: 'Segoe UI', sans-serif; background: linear-gradient(135deg, #667eea, #764ba2); 
-               min-height: 100vh; padding: 20px; }}
-        .container {{ max-width: 900px; margin: 0 auto; background: white; border-radius: 15px; 
-                     box-shadow: 0 20px 40px rgba(0,0,0,0.1); overflow: hidden; }}
-        .header {{ background: linear-gradient(45deg, #2196F3, #21CBF3); color: white; padding: 30px; text-align: center; }}
-        .content {{ padding: 30px; }}
-        .email-preview {{ background: #f8f9fa; border: 2px solid #e9ecef; border-radius: 8px; 
-                         padding: 20px; margin: 20px 0; max-height: 400px; overflow-y: auto; }}
-        .attachment-section {{ background: #e8f5e8; padding: 15px; border-radius: 8px; margin: 15px 0; 
-                              border: 2px solid #4CAF50; }}
-        .form-group {{ margin: 15px 0; }}
-        label {{ display: block; margin-bottom: 5px; font-weight: 600; color: #333; }}
-        input {{ width: 100%; padding: 12px; border: 2px solid #ddd; border-radius: 8px; }}
-        .btn {{ padding: 12px 20px; border: none; border-radius: 8px; font-weight: 600; 
-               cursor: pointer; text-decoration: none; display: inline-block; margin: 5px; }}
-        .btn-primary {{ background: #2196F3; color: white; }}
-        .btn-success {{ background: #4CAF50; color: white; }}
-        .btn-warning {{ background: #FF9800; color: white; }}
-        .btn-group {{ display: flex; gap: 10px; flex-wrap: wrap; margin: 20px 0; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🏥 Advanced Healthcare Email System</h1>
-            <p>Comprehensive Medical Report & Appointment Management</p>
-        </div>
-        
-        <div class="content">
-            <div class="form-group">
-                <label>📧 Patient Email:</label>
-                <input type="email" value="{patient_email}" readonly>
-            </div>
-            
-            <div class="form-group">
-                <label>📋 Subject:</label>
-                <input type="text" value="{subject}" readonly>
-            </div>
-            
-            {pdf_attachment_html}
-            
-            <div class="form-group">
-                <label>💌 Email Content:</label>
-                <div class="email-preview">{body_html}</div>
-            </div>
-            
-            <div class="btn-group">
-                <a href="https://mail.google.com/mail/?view=cm&fs=1&to={patient_email}&su={subject}&body={body.replace(' ', '%20').replace('\n', '%0A')}" 
-                   target="_blank" class="btn btn-primary">📧 Send via Gmail</a>
-                <a href="mailto:{patient_email}?subject={subject}&body={body}" class="btn btn-warning">📧 Default Email</a>
-                <button onclick="copyContent()" class="btn btn-success">📋 Copy All Content</button>
-            </div>
-        </div>
-    </div>
-    
-    <script>
-        function copyContent() {{
-            const content = `To: {patient_email}\\nSubject: {subject}\\n\\n{body}`;
-            navigator.clipboard.writeText(content).then(() => {{
-                alert('📋 Email content copied to clipboard!');
-            }});
-        }}
-        setTimeout(() => {{
-            document.querySelector('a[href*="gmail"]').click();
-        }}, 2000);
-    </script>
-</body>
-</html>"""
-        return html_content
-    
-    def get_enhanced_patient_input(self):
-        """Enhanced patient input collection with medical history"""
-        print("\n👤 PATIENT INFORMATION COLLECTION")
-        print("=" * 50)
-        
-        name = input("Patient Name: ").strip()
-        email = input("📧 Email Address: ").strip()
-        
-        print("\n🩺 Current Symptoms (type 'done' when finished):")
-        symptoms = []
-        while True:
-            symptom = input(f"Symptom {len(symptoms)+1}: ").strip()
-            if symptom.lower() == 'done':
-                break
-            if symptom:
-                symptoms.append(symptom)
-        
-        print("\n📋 Medical History (optional - press Enter to skip):")
-        medical_history = input("Previous conditions, medications, family history: ").strip()
-        if not medical_history:
-            medical_history = "No significant medical history reported."
-        
-        return {
-            'name': name, 
-            'email': email, 
-            'symptoms': symptoms,
-            'medical_history': medical_history
-        }
-    
-    def process_patient(self, patient_data: dict) -> dict:
-        """Enhanced patient processing with comprehensive medical analysis"""
-        print(f"\n🚀 Processing comprehensive medical case for: {patient_data['name']}")
-        print("=" * 60)
-        
-        try:
-            # Create specialized agents
-            print("🤖 Initializing medical AI agents...")
-            history_agent = self.create_medical_history_agent()
-            symptom_agent = self.create_symptom_analyzer()
-            scheduler_agent = self.create_appointment_scheduler()
-            
-            # Step 1: Medical History Analysis
-            print("\n📋 STEP 1: Comprehensive Medical History Analysis")
-            history_task = self.create_medical_history_task(history_agent, patient_data)
-            history_crew = Crew(agents=[history_agent], tasks=[history_task], process=Process.sequential)
-            history_analysis = history_crew.kickoff()
-            
-            # Step 2: Current Symptom Analysis
-            print("\n🩺 STEP 2: Clinical Symptom Assessment")
-            symptom_task = self.create_symptom_analysis_task(symptom_agent, patient_data, str(history_analysis))
-            symptom_crew = Crew(agents=[symptom_agent], tasks=[symptom_task], process=Process.sequential)
-            clinical_assessment = symptom_crew.kickoff()
-            
-            # Step 3: Appointment Coordination
-            print("\n📅 STEP 3: Healthcare Appointment Coordination")
-            scheduling_task = self.create_scheduling_task(scheduler_agent, patient_data, str(clinical_assessment))
-            scheduling_crew = Crew(agents=[scheduler_agent], tasks=[scheduling_task], process=Process.sequential)
-            appointment_coordination = scheduling_crew.kickoff()
-            
-            # Generate appointment details
-            specialty = self.determine_specialty(patient_data['symptoms'])
-            urgency = "routine"
-            
-            # Extract urgency from clinical assessment
-            assessment_text = str(clinical_assessment).upper()
-            if "EMERGENCY" in assessment_text:
-                urgency = "emergency"
-            elif "URGENT" in assessment_text:
-                urgency = "urgent"
-            
-            appointment_details = self.generate_appointment_details(specialty, patient_data['name'], urgency)
-            
-            # Generate comprehensive PDF report
-            print("\n📄 STEP 4: Generating Comprehensive Medical Report")
-            pdf_path = self.report_generator.generate_pdf_report(
-                patient_data, str(history_analysis), appointment_details
-            )
-            
-            # Create email content
-            email_subject = f"Medical Report & Appointment - {patient_data['name']} - {appointment_details['appointment_id']}"
-            email_body = f"""Dear {patient_data['name']},
-
-Your comprehensive medical assessment has been completed. Please find attached your detailed medical report.
-
-APPOINTMENT CONFIRMED:
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-👨‍⚕️ Doctor: {appointment_details['doctor']}
-🏥 Specialty: {appointment_details['specialty']}
-📅 Date: {appointment_details['date']}
-⏰ Time: {appointment_details['time']}
-📍 Location: {appointment_details['location']}
-🆔 Appointment ID: {appointment_details['appointment_id']}
-
-IMPORTANT INSTRUCTIONS:
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-• Please review the attached medical report before your appointment
-• Arrive 15 minutes early with valid ID and insurance
-• Bring all current medications and previous medical records
-• Prepare questions based on the medical analysis provided
-
-MEDICAL SUMMARY:
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-Current Symptoms: {', '.join(patient_data['symptoms'])}
-Assessment: {str(clinical_assessment)[:200]}...
-
-For questions: {appointment_details['doctor_email']}
-Emergency: Call 108
-
-Best regards,
-AI Healthcare System
-Bengaluru Medical Network"""
-            
-            # Launch enhanced web email interface
-            print("\n🌐 STEP 5: Launching Enhanced Email Interface")
-            html_content = self.create_web_email_interface(patient_data['email'], email_subject, email_body, pdf_path)
-            
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
-                f.write(html_content)
-                webbrowser.open(f'file://{f.name}')
-            
-            print("✅ COMPREHENSIVE MEDICAL PROCESSING COMPLETED!")
-            print(f"📄 Medical report generated: {pdf_path}")
-            print("🌐 Enhanced email interface launched with PDF attachment support")
-            
-            return {
-                'success': True,
-                'patient_info': patient_data,
-                'medical_history_analysis': str(history_analysis),
-                'clinical_assessment': str(clinical_assessment),
-                'appointment_details': appointment_details,
-                'pdf_report_path': pdf_path,
-                'urgency': urgency
-            }
-            
-        except Exception as e:
-            print(f"❌ Processing failed: {str(e)}")
-            return {'success': False, 'error': str(e)}
-    
     def run_interactive_system(self):
         """Main interactive loop"""
         print("🎯 Welcome to the Healthcare Assistance System!")
@@ -612,27 +611,6 @@ Bengaluru Medical Network"""
                     print("Stay healthy and safe! 💙")
                     break
     
-    def _handle_complete_appointment_system(self):
-        """Handle complete appointment system with medical analysis"""
-        print("\n📅 COMPLETE APPOINTMENT SYSTEM")
-        print("="*60)
-        print("🏥 Comprehensive medical assessment with appointment scheduling")
-        print("📋 Includes: History Analysis + Symptom Analysis + Appointment + PDF Report")
-        print("="*60)
-        
-        try:
-            patient_data = self.get_enhanced_patient_input()
-            results = self.process_patient(patient_data)
-            
-            if results['success']:
-                print(f"\n🎉 Advanced medical processing completed successfully!")
-                print(f"📊 Comprehensive analysis generated with PDF report")
-            else:
-                print(f"❌ Processing failed: {results['error']}")
-                
-        except Exception as e:
-            print(f"❌ Error in appointment system: {e}")
-    
     def _handle_emergency(self):
         """Handle emergency situations"""
         print("\n🚨 EMERGENCY FIRST AID SERVICE")
@@ -651,6 +629,9 @@ Bengaluru Medical Network"""
         print("\n🔄 Processing emergency information...")
         
         try:
+            from EmergencyAgent.agents import emergency_agent
+            from EmergencyAgent.tasks import create_firstaid_task
+            
             # Create the task with user input
             firstaid_task = create_firstaid_task(user_input)
             
@@ -683,6 +664,10 @@ Bengaluru Medical Network"""
         print("="*50)
         
         try:
+            from SymptomAgent.agents import create_symptom_checker_agent
+            from SymptomAgent.task import create_diagnosis_task
+            from SymptomAgent.tools import get_diseases_from_neo4j, get_all_symptoms_from_neo4j, close_driver
+            
             # Create symptom checker agent
             agent = create_symptom_checker_agent(self.openai_api_key)
 
@@ -817,6 +802,9 @@ Bengaluru Medical Network"""
 
             print(f"\n🔄 Analyzing medical history ({len(medical_history)} characters)...")
 
+            from HistoryAgent.agents import medical_history_agent
+            from HistoryAgent.task import create_history_analysis_task
+            
             # Create task
             history_task = create_history_analysis_task(medical_history, medical_history_agent)
 
@@ -837,6 +825,7 @@ Bengaluru Medical Network"""
             # Generate PDF report
             print("\n🔄 Generating PDF report...")
             try:
+                from HistoryAgent.pdf_generator import generate_medical_report_pdf
                 pdf_filename = generate_medical_report_pdf(result, patient_name)
                 print(f"✅ PDF Report generated successfully: {pdf_filename}")
                 print("📁 You can find the report in your current directory.")
@@ -935,7 +924,7 @@ Bengaluru Medical Network"""
                        You have extensive knowledge of medical conditions, drug interactions, and clinical patterns.""",
             tools=[extract_medical_features],
             llm=self.llm,
-            verbose=True,
+            verbose=AGENT_VERBOSE,
             allow_delegation=False
         )
     
@@ -948,7 +937,7 @@ Bengaluru Medical Network"""
                        and recommends appropriate specialist referrals based on clinical presentation. You can assess 
                        symptom combinations and provide differential diagnoses.""",
             llm=self.llm,
-            verbose=True,
+            verbose=AGENT_VERBOSE,
             allow_delegation=False
         )
     
@@ -960,7 +949,7 @@ Bengaluru Medical Network"""
                        and patient needs to coordinate optimal healthcare appointments. You understand medical specialties 
                        and can match symptoms to appropriate healthcare providers.""",
             llm=self.llm,
-            verbose=True,
+            verbose=AGENT_VERBOSE,
             allow_delegation=False
         )
     
@@ -971,6 +960,7 @@ Bengaluru Medical Network"""
         if MODULAR_AGENTS_AVAILABLE:
             try:
                 # Use modular task creation
+                from HistoryAgent.task import create_history_analysis_task
                 return create_history_analysis_task(medical_history, agent)
             except Exception as e:
                 print(f"⚠️ Error using modular history task, falling back: {e}")
@@ -1001,6 +991,9 @@ Bengaluru Medical Network"""
         
         if MODULAR_AGENTS_AVAILABLE:
             try:
+                from SymptomAgent.task import create_diagnosis_task
+                from SymptomAgent.tools import get_diseases_from_neo4j
+                
                 # Get diseases from Neo4j if available
                 matched_diseases = get_diseases_from_neo4j(symptoms, top_n=5)
                 return create_diagnosis_task(agent, symptoms, matched_diseases)
@@ -1029,44 +1022,38 @@ Bengaluru Medical Network"""
             expected_output="Clinical assessment with urgency level and specialist recommendation"
         )
     
-    def create_scheduling_task(self, agent: Agent, patient_data: dict, clinical_assessment: str) -> Task:
+    def create_scheduling_task(self, agent: Agent, patient_data: dict, clinical_assessment: str = None,
+                               context: list = None) -> Task:
+        if clinical_assessment is None:
+            clinical_assessment = "See the clinical assessment in the task context."
         return Task(
-            description=f"""
-            Coordinate healthcare appointment for: {patient_data['name']}
-            
+            description=SCHEDULING_INSTRUCTIONS + f"""
+            Patient: {patient_data['name']}
             Clinical Assessment: {clinical_assessment}
-            Available Providers: {HEALTHCARE_PROVIDERS}
-            
-            Determine:
-            1. Most appropriate healthcare provider match
-            2. Optimal appointment timing based on urgency
-            3. Pre-appointment preparation requirements
-            4. Follow-up care coordination needs
-            
-            Provide structured appointment coordination plan.
             """,
             agent=agent,
+            context=context,
             expected_output="Detailed appointment coordination with provider matching and timing recommendations"
         )
     
     def determine_specialty(self, symptoms: list) -> str:
         symptom_text = " ".join(symptoms).lower()
-        for specialty, provider in HEALTHCARE_PROVIDERS.items():
-            if any(spec in symptom_text for spec in provider['specializations']):
-                return specialty
-        return "internal_medicine"
+        return next((_SPEC_INDEX[k] for k in _SPEC_KEYWORDS if k in symptom_text), "internal_medicine")
     
-    def generate_appointment_details(self, specialty: str, patient_name: str, urgency: str = "routine") -> dict:
+    def generate_appointment_details(self, specialty: str, patient_name: str, urgency: str = "routine",
+                                     now: datetime = None, timestamp: str = None) -> dict:
         provider = HEALTHCARE_PROVIDERS.get(specialty, HEALTHCARE_PROVIDERS['internal_medicine'])
+        now = now or datetime.now()
+        timestamp = timestamp or now.strftime('%Y%m%d_%H%M%S')
         
         if urgency.lower() == "emergency":
-            date = datetime.now().strftime('%Y-%m-%d')
+            date = now.strftime('%Y-%m-%d')
             time = "IMMEDIATE - Emergency Department"
         elif urgency.lower() == "urgent":
-            date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+            date = (now + timedelta(days=1)).strftime('%Y-%m-%d')
             time = "09:00 AM"
         else:
-            date = (datetime.now() + timedelta(days=3)).strftime('%Y-%m-%d')
+            date = (now + timedelta(days=3)).strftime('%Y-%m-%d')
             time = "10:00 AM"
         
         return {
@@ -1077,150 +1064,110 @@ Bengaluru Medical Network"""
             'time': time,
             'location': provider['location'],
             'doctor_email': provider['email'],
-            'appointment_id': f"APPT_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            'appointment_id': f"APPT_{timestamp}"
         }
     
     def create_web_email_interface(self, patient_email: str, subject: str, body: str, pdf_path: str = None) -> str:
-        """Enhanced email interface with PDF attachment support"""
+        """Write the email interface (linking the PDF report) to a temp HTML file and return its path"""
+        to, su, body_q = quote(patient_email, safe='@'), quote(subject, safe=''), quote(body, safe='')
+        values = {
+            'patient_email': html.escape(patient_email),
+            'subject': html.escape(subject),
+            'body_html': html.escape(body).replace('\n', '<br>'),
+            'gmail_url': html.escape(f"https://mail.google.com/mail/?view=cm&fs=1&to={to}&su={su}&body={body_q}"),
+            'mailto_url': html.escape(f"mailto:{to}?subject={su}&body={body_q}"),
+            'copy_text': json.dumps(f"To: {patient_email}\nSubject: {subject}\n\n{body}").replace('</', '<\\/'),
+        }
         
-        pdf_attachment_html = ""
-        if pdf_path and os.path.exists(pdf_path):
-            with open(pdf_path, 'rb') as f:
-                pdf_base64 = base64.b64encode(f.read()).decode()
-            pdf_attachment_html = f'''
+        pdf_stat = None
+        if pdf_path:
+            try:
+                pdf_stat = os.stat(pdf_path)
+            except FileNotFoundError:
+                pass
+        
+        with tempfile.NamedTemporaryFile(mode='wb', buffering=1 << 20, suffix='.html', delete=False) as f:
+            f.write(EMAIL_PAGE_HEAD.substitute(values).encode('utf-8'))
+            if pdf_stat is not None:
+                # Link the report on disk; the page is itself opened via file://
+                pdf_uri = html.escape(Path(os.path.abspath(pdf_path)).as_uri())
+                f.write(f'''
             <div class="attachment-section">
                 <h3>📎 Medical Report Attachment</h3>
-                <a href="data:application/pdf;base64,{pdf_base64}" download="medical_report.pdf" 
-                   class="btn btn-success">📄 Download Medical Report</a>
-            </div>'''
-        
-        body_html = body.replace('\n', '<br>').replace('"', '&quot;')
-        
-        html_content = f"""
-<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="UTF-8">
-    <title>Healthcare Email System</title>
-    <style>
-        body {{ font-family: 'Segoe UI', sans-serif; background: linear-gradient(135deg, #667eea, #764ba2); 
-               min-height: 100vh; padding: 20px; }}
-        .container {{ max-width: 900px; margin: 0 auto; background: white; border-radius: 15px; 
-                     box-shadow: 0 20px 40px rgba(0,0,0,0.1); overflow: hidden; }}
-        .header {{ background: linear-gradient(45deg, #2196F3, #21CBF3); color: white; padding: 30px; text-align: center; }}
-        .content {{ padding: 30px; }}
-        .email-preview {{ background: #f8f9fa; border: 2px solid #e9ecef; border-radius: 8px; 
-                         padding: 20px; margin: 20px 0; max-height: 400px; overflow-y: auto; }}
-        .attachment-section {{ background: #e8f5e8; padding: 15px; border-radius: 8px; margin: 15px 0; 
-                              border: 2px solid #4CAF50; }}
-        .form-group {{ margin: 15px 0; }}
-        label {{ display: block; margin-bottom: 5px; font-weight: 600; color: #333; }}
-        input {{ width: 100%; padding: 12px; border: 2px solid #ddd; border-radius: 8px; }}
-        .btn {{ padding: 12px 20px; border: none; border-radius: 8px; font-weight: 600; 
-               cursor: pointer; text-decoration: none; display: inline-block; margin: 5px; }}
-        .btn-primary {{ background: #2196F3; color: white; }}
-        .btn-success {{ background: #4CAF50; color: white; }}
-        .btn-warning {{ background: #FF9800; color: white; }}
-        .btn-group {{ display: flex; gap: 10px; flex-wrap: wrap; margin: 20px 0; }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🏥 Advanced Healthcare Email System</h1>
-            <p>Comprehensive Medical Report & Appointment Management</p>
-        </div>
-        
-        <div class="content">
-            <div class="form-group">
-                <label>📧 Patient Email:</label>
-                <input type="email" value="{patient_email}" readonly>
-            </div>
-            
-            <div class="form-group">
-                <label>📋 Subject:</label>
-                <input type="text" value="{subject}" readonly>
-            </div>
-            
-            {pdf_attachment_html}
-            
-            <div class="form-group">
-                <label>💌 Email Content:</label>
-                <div class="email-preview">{body_html}</div>
-            </div>
-            
-            <div class="btn-group">
-                <a href="https://mail.google.com/mail/?view=cm&fs=1&to={patient_email}&su={subject}&body={body.replace(' ', '%20').replace('\n', '%0A')}" 
-                   target="_blank" class="btn btn-primary">📧 Send via Gmail</a>
-                <a href="mailto:{patient_email}?subject={subject}&body={body}" class="btn btn-warning">📧 Default Email</a>
-                <button onclick="copyContent()" class="btn btn-success">📋 Copy All Content</button>
-            </div>
-        </div>
-    </div>
-    
-    <script>
-        function copyContent() {{
-            const content = `To: {patient_email}\\nSubject: {subject}\\n\\n{body}`;
-            navigator.clipboard.writeText(content).then(() => {{
-                alert('📋 Email content copied to clipboard!');
-            }});
-        }}
-        setTimeout(() => {{
-            document.querySelector('a[href*="gmail"]').click();
-        }}, 2000);
-    </script>
-</body>
-</html>"""
-        return html_content
+                <a href="{pdf_uri}" download="medical_report.pdf" target="_blank"
+                   class="btn btn-success">📄 Open Medical Report</a>
+            </div>'''.encode('utf-8'))
+            f.write(EMAIL_PAGE_TAIL.substitute(values).encode('utf-8'))
+        return f.name
     
     def process_patient(self, patient_data: dict) -> dict:
         """Enhanced patient processing with comprehensive medical analysis"""
-        print(f"\n🚀 Processing comprehensive medical case for: {patient_data['name']}")
-        print("=" * 60)
+        logger.info("🚀 Processing comprehensive medical case for: %s", patient_data['name'])
+        logger.info("=" * 60)
+        
+        # One clock reading per patient keeps the appointment ID, report
+        # date and PDF filename in agreement
+        now = datetime.now()
+        timestamp = now.strftime('%Y%m%d_%H%M%S')
         
         try:
             # Create specialized agents
-            print("🤖 Initializing medical AI agents...")
+            logger.info("🤖 Initializing medical AI agents...")
             history_agent = self.create_medical_history_agent()
             symptom_agent = self.create_symptom_analyzer()
             scheduler_agent = self.create_appointment_scheduler()
             
-            # Step 1: Medical History Analysis
-            print("\n📋 STEP 1: Comprehensive Medical History Analysis")
-            history_task = self.create_medical_history_task(history_agent, patient_data)
-            history_crew = Crew(agents=[history_agent], tasks=[history_task], process=Process.sequential)
-            history_analysis = history_crew.kickoff()
-            
-            # Step 2: Current Symptom Analysis
-            print("\n🩺 STEP 2: Clinical Symptom Assessment")
-            symptom_task = self.create_symptom_analysis_task(symptom_agent, patient_data, str(history_analysis))
-            symptom_crew = Crew(agents=[symptom_agent], tasks=[symptom_task], process=Process.sequential)
-            clinical_assessment = symptom_crew.kickoff()
-            
-            # Step 3: Appointment Coordination
-            print("\n📅 STEP 3: Healthcare Appointment Coordination")
-            scheduling_task = self.create_scheduling_task(scheduler_agent, patient_data, str(clinical_assessment))
-            scheduling_crew = Crew(agents=[scheduler_agent], tasks=[scheduling_task], process=Process.sequential)
-            appointment_coordination = scheduling_crew.kickoff()
-            
-            # Generate appointment details
-            specialty = self.determine_specialty(patient_data['symptoms'])
-            urgency = "routine"
-            
-            # Extract urgency from clinical assessment
-            assessment_text = str(clinical_assessment).upper()
-            if "EMERGENCY" in assessment_text:
-                urgency = "emergency"
-            elif "URGENT" in assessment_text:
-                urgency = "urgent"
-            
-            appointment_details = self.generate_appointment_details(specialty, patient_data['name'], urgency)
-            
-            # Generate comprehensive PDF report
-            print("\n📄 STEP 4: Generating Comprehensive Medical Report")
-            pdf_path = self.report_generator.generate_pdf_report(
-                patient_data, str(history_analysis), appointment_details
-            )
+            # One sequential crew runs all three tasks; each task receives the
+            # previous output through context= rather than prompt interpolation.
+            # The specialty lookup and the PDF report run on a worker alongside it.
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                specialty_future = executor.submit(self.determine_specialty, patient_data['symptoms'])
+                urgency = "routine"
+                appointment_details = None
+                pdf_future = None
+                
+                def on_clinical_assessment(output):
+                    # Runs when the symptom task completes, so the report is
+                    # rendered while the scheduling task is still in flight
+                    nonlocal urgency, appointment_details, pdf_future
+                    # Extract urgency from clinical assessment (EMERGENCY outranks URGENT)
+                    found = {m.lower() for m in _URGENCY_RE.findall(str(output))}
+                    urgency = "emergency" if "emergency" in found else ("urgent" if found else "routine")
+                    
+                    appointment_details = self.generate_appointment_details(
+                        specialty_future.result(), patient_data['name'], urgency, now=now, timestamp=timestamp
+                    )
+                    
+                    logger.info("📄 STEP 4: Generating Comprehensive Medical Report")
+                    pdf_future = executor.submit(
+                        self.report_generator.generate_pdf_report,
+                        patient_data, str(history_task.output), appointment_details,
+                        now=now, timestamp=timestamp
+                    )
+                
+                logger.info("📋 STEP 1: Comprehensive Medical History Analysis")
+                history_task = self.create_medical_history_task(history_agent, patient_data)
+                
+                logger.info("🩺 STEP 2: Clinical Symptom Assessment")
+                symptom_task = self.create_symptom_analysis_task(symptom_agent, patient_data, context=[history_task])
+                symptom_task.callback = on_clinical_assessment
+                
+                logger.info("📅 STEP 3: Healthcare Appointment Coordination")
+                scheduling_task = self.create_scheduling_task(scheduler_agent, patient_data, context=[symptom_task])
+                
+                crew = Crew(
+                    agents=[history_agent, symptom_agent, scheduler_agent],
+                    tasks=[history_task, symptom_task, scheduling_task],
+                    process=Process.sequential,
+                    memory=False
+                )
+                history_analysis, clinical_assessment, appointment_coordination = crew.kickoff().tasks_output
+                if pdf_future is None:
+                    # The task callback did not run (or failed before submitting the
+                    # report), so book and render from the finished assessment instead
+                    logger.warning("⚠️ Clinical assessment callback did not run; generating the report inline")
+                    on_clinical_assessment(clinical_assessment)
+                pdf_path = pdf_future.result()
             
             # Create email content
             email_subject = f"Medical Report & Appointment - {patient_data['name']} - {appointment_details['appointment_id']}"
@@ -1257,16 +1204,13 @@ AI Healthcare System
 Bengaluru Medical Network"""
             
             # Launch enhanced web email interface
-            print("\n🌐 STEP 5: Launching Enhanced Email Interface")
-            html_content = self.create_web_email_interface(patient_data['email'], email_subject, email_body, pdf_path)
-            
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
-                f.write(html_content)
-                webbrowser.open(f'file://{f.name}')
+            logger.info("🌐 STEP 5: Launching Enhanced Email Interface")
+            html_path = self.create_web_email_interface(patient_data['email'], email_subject, email_body, pdf_path)
+            webbrowser.open(f'file://{html_path}')
             
-            print("✅ COMPREHENSIVE MEDICAL PROCESSING COMPLETED!")
-            print(f"📄 Medical report generated: {pdf_path}")
-            print("🌐 Enhanced email interface launched with PDF attachment support")
+            logger.info("✅ COMPREHENSIVE MEDICAL PROCESSING COMPLETED!")
+            logger.info("📄 Medical report generated: %s", pdf_path)
+            logger.info("🌐 Enhanced email interface launched with PDF attachment support")
             
             return {
                 'success': True,
@@ -1279,8 +1223,10 @@ Bengaluru Medical Network"""
             }
             
         except Exception as e:
-            print(f"❌ Processing failed: {str(e)}")
+            logger.error("❌ Processing failed: %s", e)
             return {'success': False, 'error': str(e)}
+        finally:
+            _log_buffer.flush()
 
 def get_enhanced_patient_input():
     """Enhanced patient input collection with medical history"""
@@ -17,6 +17,10 @@ def create_knowledge_graph(csv_path):
         print("[1/3] Deleting all previous nodes and relationships from the database...")
         session.run("MATCH (n) DETACH DELETE n")
         print("   --> Database cleaned.")
+        # Index before loading, so every MERGE/MATCH below is a seek instead of a label scan
+        session.run("CREATE INDEX disease_name_idx IF NOT EXISTS FOR (d:Disease) ON (d.name)")
+        session.run("CREATE INDEX symptom_name_idx IF NOT EXISTS FOR (s:Symptom) ON (s.name)")
+        session.run("CREATE INDEX symptom_name_lc IF NOT EXISTS FOR (s:Symptom) ON (s.name_lc)")
 
         print("[2/3] Populating graph from CSV...")
         for idx, row in df.iterrows():
@@ -29,7 +33,7 @@ def create_knowledge_graph(csv_path):
                 if val == 1:
                     symptom = symptoms[i]
                     # Create Symptom node
-                    session.run("MERGE (s:Symptom {name: $symptom})", symptom=symptom)
+                    session.run("MERGE (s:Symptom {name: $symptom}) ON CREATE SET s.name_lc = toLower($symptom)", symptom=symptom)
                     # Create relationship
                     session.run("""
                         MATCH (d:Disease {name: $disease}), (s:Symptom {name: $symptom})
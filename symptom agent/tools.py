@@ -1,5 +1,6 @@
 from neo4j import GraphDatabase
 import os
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -7,9 +8,45 @@ load_dotenv()
 NEO4J_URI = os.getenv("NEO4J_URI")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
 
-# Create driver instance
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+_driver = None
+_name_lc_ready = False
+_name_lc_checked_at = None
+NAME_LC_RECHECK_SECONDS = 300
+
+def _get_driver():
+    """Create the shared Neo4j driver on first use."""
+    global _driver
+    if _driver is None:
+        _driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USERNAME, NEO4J_PASSWORD))
+    return _driver
+
+def symptom_name_lc_ready():
+    """
+    Check (read-only) whether every Symptom has the normalized name_lc property
+    that populate.py writes and indexes.
+    
+    Graphs loaded before that property existed are queried on toLower(s.name)
+    instead; re-run populate.py to enable the indexed lookup. Only a positive
+    answer is kept for the life of the process; a negative one is re-checked
+    after NAME_LC_RECHECK_SECONDS, so a re-populated graph is picked up.
+    """
+    global _name_lc_ready, _name_lc_checked_at
+    if _name_lc_ready:
+        return True
+    now = time.monotonic()
+    if _name_lc_checked_at is not None and now - _name_lc_checked_at < NAME_LC_RECHECK_SECONDS:
+        return False
+    first_check = _name_lc_checked_at is None
+    _name_lc_checked_at = now
+    records, _, _ = _get_driver().execute_query(
+        "MATCH (s:Symptom) WHERE s.name_lc IS NULL RETURN s.name LIMIT 1",
+        database_=NEO4J_DATABASE)
+    _name_lc_ready = not records
+    if not _name_lc_ready and first_check:
+        print("Symptom nodes lack name_lc; re-run populate.py for indexed symptom lookups.")
+    return _name_lc_ready
 
 def get_diseases_from_neo4j(user_symptoms, top_n=5):
     """
@@ -22,28 +59,41 @@ def get_diseases_from_neo4j(user_symptoms, top_n=5):
     Returns:
         list: List of dictionaries with disease information
     """
-    with driver.session() as session:
-        try:
-            result = session.run("""
+    try:
+        driver = _get_driver()
+        # Deduplicate so UNWIND doesn't count a repeated symptom twice
+        symptom_list = list(dict.fromkeys(s.lower().strip() for s in user_symptoms))
+        if symptom_name_lc_ready():
+            # Seek each symptom on the name_lc index, then expand to its diseases
+            query = """
+                UNWIND $symptom_list AS sname
+                MATCH (s:Symptom {name_lc: sname})<-[:HAS_SYMPTOM]-(d:Disease)
+                WITH d, collect(s.name) as matched_symptoms, count(*) as match_count
+                ORDER BY match_count DESC LIMIT $top_n
+                RETURN d.name as disease, matched_symptoms, match_count
+            """
+        else:
+            query = """
                 MATCH (d:Disease)-[:HAS_SYMPTOM]->(s:Symptom)
                 WHERE toLower(s.name) IN $symptom_list
                 WITH d, collect(s.name) as matched_symptoms, count(*) as match_count
-                ORDER BY match_count DESC
+                ORDER BY match_count DESC LIMIT $top_n
                 RETURN d.name as disease, matched_symptoms, match_count
-                LIMIT $top_n
-            """, symptom_list=[s.lower().strip() for s in user_symptoms], top_n=top_n)
-            
-            return [
-                {
-                    "disease": record["disease"],
-                    "matched_symptoms": record["matched_symptoms"],
-                    "match_count": record["match_count"]
-                }
-                for record in result
-            ]
-        except Exception as e:
-            print(f"Error querying Neo4j: {e}")
-            return []
+            """
+        records, _, _ = driver.execute_query(query, symptom_list=symptom_list, top_n=top_n,
+                                             database_=NEO4J_DATABASE)
+        
+        return [
+            {
+                "disease": record["disease"],
+                "matched_symptoms": record["matched_symptoms"],
+                "match_count": record["match_count"]
+            }
+            for record in records
+        ]
+    except Exception as e:
+        print(f"Error querying Neo4j: {e}")
+        return []
 
 def get_all_symptoms_from_neo4j():
     """
@@ -52,18 +102,20 @@ def get_all_symptoms_from_neo4j():
     Returns:
         list: List of all symptom names
     """
-    with driver.session() as session:
-        try:
-            result = session.run("MATCH (s:Symptom) RETURN s.name as symptom ORDER BY s.name")
-            return [record["symptom"] for record in result]
-        except Exception as e:
-            print(f"Error retrieving symptoms: {e}")
-            return []
+    try:
+        records, _, _ = _get_driver().execute_query("MATCH (s:Symptom) RETURN s.name as symptom ORDER BY s.name",
+                                                    database_=NEO4J_DATABASE)
+        return [record["symptom"] for record in records]
+    except Exception as e:
+        print(f"Error retrieving symptoms: {e}")
+        return []
 
 def close_driver():
     """Close the Neo4j driver connection."""
-    if driver:
-        driver.close()
+    global _driver
+    if _driver is not None:
+        _driver.close()
+        _driver = None
 
 
 